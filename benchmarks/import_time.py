@@ -0,0 +1,86 @@
+"""Import-time budget check for the ensemble_eeg modules.
+
+Every module is imported in a fresh interpreter. The check fails when an
+import takes longer than its budget, or when it loads a heavy dependency
+that should only be imported when it is used:
+
+    python benchmarks/import_time.py --repeat 5
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+# module: (budget in ms on top of numpy, dependencies that must not be loaded)
+BUDGETS = {
+    "ensemble_eeg": (50, ("numpy", "fire", "dateparser", "defusedxml")),
+    "ensemble_eeg.ensemble_edf": (100, ("fire", "dateparser")),
+    "ensemble_eeg.brm_to_edf": (100, ("fire", "dateparser", "defusedxml")),
+    "ensemble_eeg.__main__": (100, ("fire", "dateparser")),
+    "ensemble_eeg.catalog": (100, ("fire", "dateparser")),
+    "ensemble_eeg.qc": (100, ("fire", "dateparser")),
+    "ensemble_eeg.aeeg": (100, ("fire", "dateparser", "defusedxml")),
+    "ensemble_eeg.resample": (100, ("fire", "dateparser", "defusedxml")),
+    "ensemble_eeg.annotations": (100, ("fire", "dateparser", "defusedxml")),
+    "ensemble_eeg.manifest": (50, ("fire", "dateparser", "defusedxml")),
+    "ensemble_eeg.verify": (100, ("fire", "dateparser", "defusedxml")),
+}
+
+PROBE = """
+import json, sys, time
+{baseline}
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps([elapsed, sorted(m.split(".")[0] for m in sys.modules)]))
+"""
+
+
+def measure(module, repeat):
+    """Returns the fastest import time of module in ms and the modules it loaded."""
+    # numpy is imported up front, so the budget covers ensemble_eeg itself
+    baseline = "" if module == "ensemble_eeg" else "import numpy"
+    best = None
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE.format(baseline=baseline, module=module)],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        elapsed, loaded = json.loads(output)
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1e3, set(loaded)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=list(BUDGETS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help="Factor applied to every budget, e.g. 3 on slow CI machines.",
+    )
+    args = parser.parse_args()
+
+    failures = []
+    for module in args.modules:
+        budget, forbidden = BUDGETS[module]
+        budget *= args.scale
+        milliseconds, loaded = measure(module, args.repeat)
+        problems = [f"loads {name}" for name in forbidden if name in loaded]
+        if milliseconds > budget:
+            problems.append(f"exceeds {budget:.0f} ms")
+        print(f"{module:<28} {milliseconds:8.1f} ms  {', '.join(problems) or 'ok'}")
+        if problems:
+            failures.append(module)
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
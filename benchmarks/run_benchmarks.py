@@ -0,0 +1,239 @@
+"""Benchmarks for the ensemble_eeg pipeline entry points.
+
+Every benchmark runs in a fresh process on synthetic data, so the reported
+peak RSS belongs to that benchmark alone. Results are stored as JSON and can
+be compared against an earlier run:
+
+    python benchmarks/run_benchmarks.py --output new.json --compare old.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic
+
+from ensemble_eeg import aeeg, brm_to_edf, ensemble_edf, resample
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+def bench_read_edf_header(files, workdir):
+    ensemble_edf.read_edf_header(files["edf"])
+    return 0
+
+
+def bench_read_edf_data(files, workdir):
+    header = ensemble_edf.read_edf_header(files["edf"])
+    for data_record in ensemble_edf.read_edf_data(files["edf"], header):
+        for signal in data_record:
+            signal.sum()
+    return header.number_of_data_records
+
+
+def bench_fix_edf_header(files, workdir):
+    fd = os.path.join(workdir, "fix.edf")
+    shutil.copy(files["edf_to_fix"], fd)
+    start = time.perf_counter()
+    ensemble_edf.fix_edf_header(fd)
+    return ensemble_edf.read_edf_header(fd).number_of_data_records, start
+
+
+def bench_anonymize_edf_header(files, workdir):
+    ensemble_edf.anonymize_edf_header(
+        files["edf"], os.path.join(workdir, "anonymized.edf")
+    )
+    return ensemble_edf.read_edf_header(files["edf"]).number_of_data_records
+
+
+def bench_combine_aeeg_channels(files, workdir):
+    left = os.path.join(workdir, "left.edf")
+    shutil.copy(files["edf_left"], left)
+    start = time.perf_counter()
+    ensemble_edf.combine_aeeg_channels(left, files["edf_right"], "combined")
+    return ensemble_edf.read_edf_header(left).number_of_data_records, start
+
+
+def bench_convert_brm_to_edf(files, workdir):
+    fd = os.path.join(workdir, "recording.brm")
+    shutil.copy(files["brm"], fd)
+    start = time.perf_counter()
+    brm_to_edf.convert_brm_to_edf(fd, is_fs_64hz=False)
+    header = ensemble_edf.read_edf_header(os.path.join(workdir, "recording.edf"))
+    return header.number_of_data_records, start
+
+
+def bench_compute_aeeg(files, workdir):
+    aeeg.compute_aeeg(files["edf"], os.path.join(workdir, "aeeg.edf"))
+    return ensemble_edf.read_edf_header(files["edf"]).number_of_data_records
+
+
+def bench_resample_edf(files, workdir):
+    resample.resample_edf(files["edf"], os.path.join(workdir, "resampled.edf"), 100)
+    return ensemble_edf.read_edf_header(files["edf"]).number_of_data_records
+
+
+BENCHMARKS = {
+    "read_edf_header": (bench_read_edf_header, "edf"),
+    "read_edf_data": (bench_read_edf_data, "edf"),
+    "fix_edf_header": (bench_fix_edf_header, "edf_to_fix"),
+    "anonymize_edf_header": (bench_anonymize_edf_header, "edf"),
+    "combine_aeeg_channels": (bench_combine_aeeg_channels, "edf_left"),
+    "convert_brm_to_edf": (bench_convert_brm_to_edf, "brm"),
+    "compute_aeeg": (bench_compute_aeeg, "edf"),
+    "resample_edf": (bench_resample_edf, "edf"),
+}
+
+
+def _run_benchmark(name, files, repeat):
+    """Runs one benchmark repeat times in this process, keeping the best time."""
+    func, input_file = BENCHMARKS[name]
+    n_bytes = os.path.getsize(files[input_file])
+    best = None
+    warnings.simplefilter("ignore")
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as workdir:
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = func(files, workdir)
+            if isinstance(result, tuple):
+                n_records, start = result
+            else:
+                n_records = result
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return {
+        "seconds": best,
+        "mb_per_second": n_bytes / 1e6 / best,
+        "records_per_second": n_records / best if n_records else None,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def generate_inputs(directory, n_records, sample_rate):
+    """Writes the synthetic input files used by the benchmarks."""
+    files = {
+        "edf": os.path.join(directory, "recording.edf"),
+        "edf_to_fix": os.path.join(directory, "to_fix.edf"),
+        "edf_left": os.path.join(directory, "left.edf"),
+        "edf_right": os.path.join(directory, "right.edf"),
+        "brm": os.path.join(directory, "recording.brm"),
+    }
+    rates = (sample_rate,) * 8 + (None,)
+    synthetic.write_synthetic_edf(files["edf"], rates, n_records)
+    synthetic.write_synthetic_edf(
+        files["edf_to_fix"], rates, n_records, starttime="10:00:00"
+    )
+    synthetic.write_synthetic_edf(
+        files["edf_left"],
+        (sample_rate, None),
+        n_records,
+        labels=["F3", "EDF Annotations"],
+        seed=1,
+    )
+    synthetic.write_synthetic_edf(
+        files["edf_right"],
+        (sample_rate, None),
+        n_records,
+        labels=["F4", "EDF Annotations"],
+        seed=2,
+    )
+    synthetic.write_synthetic_brm(files["brm"], (n_records,))
+    return files
+
+
+def run_benchmarks(names, n_records, sample_rate, repeat, directory=None):
+    """Generates the inputs and runs every benchmark in its own process."""
+    with tempfile.TemporaryDirectory(dir=directory) as tmpdir:
+        files = generate_inputs(tmpdir, n_records, sample_rate)
+        results = {}
+        for name in names:
+            with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as executor:
+                results[name] = executor.submit(
+                    _run_benchmark, name, files, repeat
+                ).result()
+            print(
+                f"{name:<24} {results[name]['seconds']:9.4f} s "
+                f"{results[name]['mb_per_second']:9.1f} MB/s "
+                f"{results[name]['peak_rss_mb']:8.1f} MB peak RSS"
+            )
+
+    return {
+        "meta": {
+            "n_records": n_records,
+            "sample_rate": sample_rate,
+            "repeat": repeat,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Prints the change against a baseline run, returns the regressed names."""
+    regressions = []
+    for name, result in results["results"].items():
+        if name not in baseline["results"]:
+            continue
+        ratio = result["seconds"] / baseline["results"][name]["seconds"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:<24} {ratio:6.2f}x baseline time{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("benchmarks", nargs="*", default=list(BENCHMARKS))
+    parser.add_argument("--records", type=int, default=3600)
+    parser.add_argument("--sample-rate", type=int, default=256)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--tmpdir", help="Directory for the synthetic inputs.")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--compare", help="JSON file of an earlier run.")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Relative slow-down reported as a regression. Defaults to 0.1.",
+    )
+    args = parser.parse_args()
+
+    results = run_benchmarks(
+        args.benchmarks, args.records, args.sample_rate, args.repeat, args.tmpdir
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""Deterministic synthetic EDF and BRM files for benchmarking.
+
+The data is generated and written in chunks, so files of several GB can be
+created without holding them in memory.
+"""
+
+import zipfile
+
+import numpy as np
+
+from ensemble_eeg import ensemble_edf
+
+CHUNK_RECORDS = 600
+ANNOTATION_BYTES = 120
+
+
+def make_edf_header(
+    sample_rates,
+    n_records,
+    duration_of_a_data_record=1,
+    labels=None,
+    starttime="10.00.00",
+):
+    """
+    Builds the header of a synthetic EDF+ file.
+
+    Parameters:
+        sample_rates (list): The number of samples in each data record for
+            every signal. Use None for an "EDF Annotations" signal.
+        n_records (int): The number of data records.
+        duration_of_a_data_record (float, optional): Defaults to 1 second.
+        labels (list, optional): The signal labels. Defaults to CH1, CH2, ...
+        starttime (str, optional): The start time of the recording. Use
+            "10:00:00" to get a header that fix_edf_header has to fix.
+
+    Returns:
+        Header: The header of the synthetic file.
+    """
+    if labels is None:
+        labels = [
+            "EDF Annotations" if fs is None else f"CH{i + 1}"
+            for i, fs in enumerate(sample_rates)
+        ]
+
+    signals = []
+    for label, fs in zip(labels, sample_rates, strict=True):
+        if fs is None:
+            signals.append(
+                ensemble_edf.SignalHeader(
+                    label, None, None, -1, 1, -32768, 32767, None,
+                    ANNOTATION_BYTES // 2, None,
+                )
+            )  # fmt: skip
+        else:
+            signals.append(
+                ensemble_edf.SignalHeader(
+                    label, "AgAgCl electrode", "uV", -3276.8, 3276.7,
+                    -32768, 32767, "HP:0.1Hz LP:75Hz", fs, None,
+                )
+            )  # fmt: skip
+
+    return ensemble_edf.Header(
+        "0",
+        "X F 01-JAN-2020 X",
+        "Startdate 05-JAN-2020 X X X",
+        "05.01.20",
+        starttime,
+        ensemble_edf.HEADER_SIZE + len(signals) * ensemble_edf.SIGNAL_HEADER_SIZE,
+        "EDF+C" if None in sample_rates else None,
+        n_records,
+        duration_of_a_data_record,
+        len(signals),
+        tuple(signals),
+    )
+
+
+def _annotation_record(onset, events=()):
+    tals = [f"+{onset:g}\x14\x14\x00"]
+    tals.extend(f"+{t:g}\x15{d:g}\x14{text}\x14\x00" for t, d, text in events)
+    raw = "".join(tals).encode("ascii")
+    assert len(raw) <= ANNOTATION_BYTES, "Too many events in one data record"
+    return raw.ljust(ANNOTATION_BYTES, b"\x00")
+
+
+def _signal_chunk(rng, fs, start, n_records, duration):
+    """Alpha-like sine plus noise, in int16 digital values."""
+    t = (start * fs + np.arange(n_records * fs)) / (fs / duration)
+    x = 400 * np.sin(2 * np.pi * 10 * t) + rng.normal(0, 150, len(t))
+    return np.clip(x, -32768, 32767).astype(np.int16)
+
+
+def write_synthetic_edf(
+    path,
+    sample_rates=(256, 256),
+    n_records=3600,
+    duration_of_a_data_record=1,
+    labels=None,
+    events=(),
+    starttime="10.00.00",
+    seed=0,
+):
+    """
+    Writes a deterministic synthetic EDF+ file.
+
+    Parameters:
+        path (str): The file to write.
+        sample_rates (list, optional): The number of samples in each data
+            record for every signal; None adds an "EDF Annotations" signal.
+            Defaults to two signals of 256 samples.
+        n_records (int, optional): The number of data records. Defaults to 3600.
+        duration_of_a_data_record (float, optional): Defaults to 1 second.
+        labels (list, optional): The signal labels.
+        events (list, optional): (onset, duration, text) tuples stored in the
+            annotation signal.
+        starttime (str, optional): The start time of the recording.
+        seed (int, optional): The seed of the random generator. Defaults to 0.
+
+    Returns:
+        Header: The header of the written file.
+    """
+    header = make_edf_header(
+        sample_rates, n_records, duration_of_a_data_record, labels, starttime
+    )
+    samples_per_record = [
+        signal.nr_of_samples_in_each_data_record for signal in header.signals
+    ]
+    rng = np.random.default_rng(seed)
+
+    ensemble_edf.write_edf_header(path, header)
+    with open(path, "ab") as fd:
+        for start in range(0, n_records, CHUNK_RECORDS):
+            stop = min(start + CHUNK_RECORDS, n_records)
+            chunks = []
+            for fs in sample_rates:
+                if fs is None:
+                    onsets = np.arange(start, stop) * duration_of_a_data_record
+                    records = b"".join(
+                        _annotation_record(
+                            onset,
+                            [
+                                event
+                                for event in events
+                                if onset <= event[0] < onset + duration_of_a_data_record
+                            ],
+                        )
+                        for onset in onsets
+                    )
+                    chunks.append(np.frombuffer(records, dtype="<i2"))
+                else:
+                    chunks.append(
+                        _signal_chunk(
+                            rng, fs, start, stop - start, duration_of_a_data_record
+                        )
+                    )
+            ensemble_edf.interleave_signals(chunks, samples_per_record).tofile(fd)
+
+    return header
+
+
+def write_synthetic_brm(path, segments=(3600,), seed=0):
+    """
+    Writes a deterministic synthetic BRM archive.
+
+    Every segment contains a left and right channel at 256 Hz
+    (DATA_RAW_EEG_ELECTRODE_*) and at 64 Hz (DATA_RAW_EEG_*).
+
+    Parameters:
+        path (str): The archive to write.
+        segments (list, optional): The length of every segment in seconds.
+            Defaults to a single segment of one hour.
+        seed (int, optional): The seed of the random generator. Defaults to 0.
+
+    Returns:
+        None
+    """
+    rng = np.random.default_rng(seed)
+    streams = []
+    for i, seconds in enumerate(segments):
+        for side in ("LEFT", "RIGHT"):
+            streams.append(
+                (f"DATA_RAW_EEG_ELECTRODE_{side}_{i}.dat", side, 256, seconds)
+            )
+            streams.append((f"DATA_RAW_EEG_{side}_{i}.dat", side, 64, seconds))
+
+    index = "".join(
+        "<FileDescription>"
+        f"<FileName>{name}</FileName>"
+        "<FileType>Int16</FileType>"
+        f"<SamplePeriod512thSeconds>{512 // fs}</SamplePeriod512thSeconds>"
+        f"<ChannelTitle>{side.title()}</ChannelTitle>"
+        "<Units>µV</Units>"
+        "</FileDescription>"
+        for name, side, fs, _ in streams
+    )
+    device = "".join(
+        f"<Channel><ID>{side}</ID><Gain>1000</Gain></Channel>"
+        for side in ("Left", "Right")
+    )
+
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zip_ref:
+        zip_ref.writestr("BRM_Index.xml", f"<BRM_Index>{index}</BRM_Index>")
+        zip_ref.writestr("Device.xml", f"<Device>{device}</Device>")
+        for name, _, fs, seconds in streams:
+            with zip_ref.open(name, "w", force_zip64=True) as f:
+                for start in range(0, seconds, CHUNK_RECORDS):
+                    n_records = min(CHUNK_RECORDS, seconds - start)
+                    f.write(_signal_chunk(rng, fs, start, n_records, 1).tobytes())
@@ -1,3 +1,8 @@
-from ensemble_eeg.__main__ import _anonymize_eeg_ensemble_main
+def _anonymize_eeg_ensemble_main():
+    # imported here, so that importing the package does not load the CLI
+    from ensemble_eeg.__main__ import _anonymize_eeg_ensemble_main
+
+    _anonymize_eeg_ensemble_main()
+
 
 __all__ = ["_anonymize_eeg_ensemble_main"]
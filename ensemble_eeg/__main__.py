@@ -1,17 +1,50 @@
+import hashlib
+import json
 import os
-import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from glob import glob
-from pathlib import Path
-
-import fire
 
 from ensemble_eeg import ensemble_edf
+from ensemble_eeg.manifest import (
+    MANIFEST_FILENAME,
+    is_done,
+    open_manifest,
+    read_manifest,
+)
+
+
+def _anonymize_to_output_dir(eeg_path, output_dir):
+    """Anonymize eeg_path directly into output_dir, keeping its filename.
+
+    Returns the manifest entry of the file: its path, size, modification
+    time, the BLAKE2b hash of its data section, the output path, and the
+    status "done", or "failed" with the error message.
+    """
+    eeg_output_path = os.path.join(output_dir, os.path.basename(eeg_path))
+    stat = os.stat(eeg_path)
+    entry = {
+        "input": os.path.abspath(eeg_path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "data_blake2b": None,
+        "output": os.path.abspath(eeg_output_path),
+        "status": "done",
+    }
+    hasher = hashlib.blake2b()
+    try:
+        ensemble_edf.anonymize_edf_header(eeg_path, eeg_output_path, hasher)
+    except Exception as err:  # noqa: BLE001
+        entry.update(status="failed", error=repr(err))
+    else:
+        entry["data_blake2b"] = hasher.hexdigest()
+    return entry
 
 
-def anonymize_eeg_ensemble(input_dir, output_dir):
+def anonymize_eeg_ensemble(input_dir, output_dir, jobs=1, resume=True):
     """Anonymize the edf files in input_dir using the ensemble_edf
-    anonymize_edf_header function, then move the anonymized edf files in
-    output_dir.
+    anonymize_edf_header function, writing the anonymized edf files directly
+    in output_dir.
 
     Parameters
     ----------
@@ -20,6 +53,22 @@ def anonymize_eeg_ensemble(input_dir, output_dir):
         stored
     output_dir: str
         Path where the anonymized edf are generated.
+    jobs: int
+        Number of worker processes used to anonymize the files. Defaults to
+        1, which anonymizes the files one after another in this process. Use
+        0 to use one worker per CPU.
+    resume: bool
+        Skip the files that the manifest in output_dir records as done and
+        that did not change since. Defaults to True. Every processed file is
+        appended to the manifest (MANIFEST_FILENAME) as soon as it finishes,
+        so an interrupted batch can be resumed.
+
+    Returns
+    -------
+    dict
+        Summary of the batch: the number of files, the number skipped, the
+        files that failed with their error message, the elapsed time, and the
+        throughput in files/s and MB/s.
     """
     # check input and output are different
     assert input_dir != output_dir, (
@@ -45,23 +94,65 @@ def anonymize_eeg_ensemble(input_dir, output_dir):
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    for eeg_path in input_eeg:
-        # anonymize the header using an ensemble_edf function
-        ensemble_edf.anonymize_edf_header(eeg_path)
-        # path where the anonymized edf is generated by ensemble_edf
-        eeg_path = Path(eeg_path)
-        eeg_anon_path = os.path.join(
-            eeg_path.parent,
-            f"{eeg_path.stem}_ANONYMIZED{eeg_path.suffix}",
-        )
-        # move the anonymized edf in the output directory
-        # and replace ANONYMIZED by the chosen suffix
-        eeg_output_path = eeg_anon_path.replace(input_dir, output_dir)
-        eeg_output_path = eeg_output_path.replace("_ANONYMIZED", "")
-        shutil.move(eeg_anon_path, eeg_output_path)
+    manifest_path = os.path.join(output_dir, MANIFEST_FILENAME)
+    manifest = read_manifest(manifest_path) if resume else {}
+    todo = [
+        eeg_path
+        for eeg_path in input_eeg
+        if not is_done(manifest.get(os.path.abspath(eeg_path)), eeg_path)
+    ]
+    if len(todo) < len(input_eeg):
+        print(f"Skipping {len(input_eeg) - len(todo)} eeg already anonymized")
+
+    start = time.perf_counter()
+    n_bytes = 0
+    failed = {}
+
+    with open_manifest(manifest_path) as manifest_file:
+
+        def record(eeg_path, entry):
+            nonlocal n_bytes
+            manifest_file.write(json.dumps(entry) + "\n")
+            manifest_file.flush()
+            if entry["status"] == "failed":
+                print(f"failed: {eeg_path}: {entry['error']}")
+                failed[eeg_path] = entry["error"]
+            else:
+                n_bytes += entry["size"]
+
+        if jobs == 1:
+            for eeg_path in todo:
+                record(eeg_path, _anonymize_to_output_dir(eeg_path, output_dir))
+        else:
+            with ProcessPoolExecutor(max_workers=jobs or None) as executor:
+                futures = {
+                    executor.submit(_anonymize_to_output_dir, eeg_path, output_dir): (
+                        eeg_path
+                    )
+                    for eeg_path in todo
+                }
+                for future in as_completed(futures):
+                    eeg_path = futures[future]
+                    record(eeg_path, future.result())
+                    if eeg_path not in failed:
+                        print(f"anonymized {eeg_path}")
+
+    elapsed = time.perf_counter() - start
+    summary = {
+        "files": len(input_eeg),
+        "skipped": len(input_eeg) - len(todo),
+        "succeeded": len(todo) - len(failed),
+        "failed": failed,
+        "seconds": round(elapsed, 3),
+        "files_per_second": round(len(todo) / elapsed, 3) if elapsed else None,
+        "mb_per_second": round(n_bytes / 1e6 / elapsed, 3) if elapsed else None,
+    }
+    return summary
 
 
 def _anonymize_eeg_ensemble_main():
+    import fire
+
     fire.Fire(anonymize_eeg_ensemble)
 
 
@@ -0,0 +1,345 @@
+import os
+
+import numpy as np
+
+from ensemble_eeg import brm_to_edf, ensemble_edf
+
+TREND_FS = 1
+AEEG_PHYSICAL_MAXIMUM = 200
+SEMILOG_THRESHOLD = 10
+
+
+def design_aeeg_filter(fs, numtaps=None):
+    """
+    Designs the asymmetric band-pass filter of the aEEG.
+
+    The linear-phase FIR filter passes 2-15 Hz with a gain rising by
+    12 dB/decade, normalized to unity at 10 Hz, and rejects frequencies
+    outside that band.
+
+    Args:
+        fs (float): The sample rate of the signal.
+        numtaps (int, optional): The (odd) length of the filter. Defaults to
+            None, which uses two seconds of samples.
+
+    Returns:
+        np.ndarray: The filter coefficients.
+    """
+    if numtaps is None:
+        numtaps = int(2 * fs) | 1
+
+    n_fft = 8 * numtaps
+    f = np.fft.rfftfreq(n_fft, 1 / fs)
+    response = np.where((f >= 2) & (f <= 15), (f / 10) ** (12 / 20), 0)
+
+    h = np.fft.irfft(response, n_fft)
+    h = np.roll(h, numtaps // 2)[:numtaps] * np.hanning(numtaps)
+    return h
+
+
+def semilog(values, threshold=SEMILOG_THRESHOLD):
+    """
+    Compresses aEEG amplitudes: linear below threshold, logarithmic above.
+
+    Args:
+        values (np.ndarray): The amplitudes.
+        threshold (float, optional): Defaults to SEMILOG_THRESHOLD (10 uV).
+
+    Returns:
+        np.ndarray: The compressed amplitudes, so that e.g. 10 stays 10 and
+            100 becomes 20.
+    """
+    values = np.asarray(values, dtype=float)
+    compressed = threshold * (1 + np.log10(np.maximum(values, threshold) / threshold))
+    return np.where(values <= threshold, values, compressed)
+
+
+class AeegEngine:
+    """
+    Computes the aEEG trend of one signal, chunk by chunk.
+
+    Every chunk is band-pass filtered with overlap-save FFT convolution,
+    rectified, and averaged over blocks of 1 / trend_fs seconds. The filter
+    history, the filter delay and the samples of incomplete blocks are
+    carried over to the next chunk, so the trend does not depend on how the
+    signal is chunked.
+
+    Args:
+        fs (float): The sample rate of the signal.
+        trend_fs (float, optional): The sample rate of the trend. fs must be
+            a multiple of it. Defaults to TREND_FS.
+        numtaps (int, optional): The length of the filter, see
+            design_aeeg_filter.
+    """
+
+    def __init__(self, fs, trend_fs=TREND_FS, numtaps=None):
+        if fs % trend_fs:
+            raise ValueError(f"Sample rate {fs} is not a multiple of {trend_fs}")
+
+        self.h = design_aeeg_filter(fs, numtaps)
+        self.delay = (len(self.h) - 1) // 2
+        self.block = int(fs // trend_fs)
+        self.history = np.zeros(len(self.h) - 1)
+        self.to_skip = self.delay
+        self.remainder = np.empty(0)
+        self._h_fft = {}
+
+    def _filter(self, x):
+        extended = np.concatenate((self.history, x))
+        n_fft = 1 << (len(extended) - 1).bit_length()
+        if n_fft not in self._h_fft:
+            self._h_fft[n_fft] = np.fft.rfft(self.h, n_fft)
+
+        y = np.fft.irfft(np.fft.rfft(extended, n_fft) * self._h_fft[n_fft], n_fft)
+        self.history = extended[len(extended) - len(self.history) :]
+        return y[len(self.history) : len(extended)]
+
+    def process(self, x):
+        """
+        Processes the next chunk of the signal.
+
+        Args:
+            x (np.ndarray): The next samples, in physical units.
+
+        Returns:
+            np.ndarray: The trend samples completed by this chunk, as
+                peak-to-peak amplitudes in the units of x.
+        """
+        rectified = np.abs(self._filter(np.asarray(x, dtype=float)))
+        skip = min(self.to_skip, len(rectified))
+        self.to_skip -= skip
+
+        rectified = np.concatenate((self.remainder, rectified[skip:]))
+        n_blocks = len(rectified) // self.block
+        self.remainder = rectified[n_blocks * self.block :]
+
+        # the mean of a rectified sine is 2 / pi of its peak-to-peak amplitude / 2
+        blocks = rectified[: n_blocks * self.block].reshape(n_blocks, self.block)
+        return np.pi * blocks.mean(axis=1)
+
+    def flush(self):
+        """
+        Pushes the filter delay out after the last chunk.
+
+        Returns:
+            np.ndarray: The remaining trend samples.
+        """
+        return self.process(np.zeros(self.delay))
+
+
+def make_aeeg_header(header, chans, trend_fs=TREND_FS, compress=False):
+    """
+    Builds the header of the EDF file holding the aEEG trends.
+
+    Args:
+        header (Header): The header of the input recording.
+        chans (list): The indices of the input signals.
+        trend_fs (float, optional): The sample rate of the trend. Defaults to
+            TREND_FS.
+        compress (bool, optional): Whether the trend is semi-logarithmically
+            compressed. Defaults to False.
+
+    Returns:
+        Header: The header of the trend file.
+    """
+    samples_per_record = trend_fs * header.duration_of_a_data_record
+    if samples_per_record != int(samples_per_record):
+        raise ValueError(
+            f"A data record of {header.duration_of_a_data_record} s does not "
+            f"hold a whole number of trend samples at {trend_fs} Hz"
+        )
+
+    physical_maximum = AEEG_PHYSICAL_MAXIMUM
+    if compress:
+        physical_maximum = round(float(semilog(physical_maximum)), 3)
+
+    signals = tuple(
+        header.signals[chan]._replace(
+            label=f"aEEG {header.signals[chan].label}"[:16],
+            prefiltering="aEEG 2-15Hz" + (" semilog" if compress else ""),
+            physical_minimum=0,
+            physical_maximum=physical_maximum,
+            digital_minimum=-32768,
+            digital_maximum=32767,
+            nr_of_samples_in_each_data_record=int(samples_per_record),
+            reserved=None,
+        )
+        for chan in chans
+    )
+    return header._replace(
+        number_of_bytes_in_header_record=ensemble_edf.HEADER_SIZE
+        + len(signals) * ensemble_edf.SIGNAL_HEADER_SIZE,
+        reserved=None,
+        number_of_signals=len(signals),
+        signals=signals,
+    )
+
+
+def _stream_aeeg(fd_out, header, chans, chunks, trend_fs, compress):
+    """
+    Writes the aEEG trends of a stream of physical chunks to fd_out.
+    """
+    out_header = make_aeeg_header(header, chans, trend_fs, compress)
+    gain, offset = ensemble_edf.get_gain_offset(out_header)
+    samples_per_record = out_header.signals[0].nr_of_samples_in_each_data_record
+    engines = [
+        AeegEngine(
+            header.signals[chan].nr_of_samples_in_each_data_record
+            / header.duration_of_a_data_record,
+            trend_fs,
+        )
+        for chan in chans
+    ]
+
+    pending = [np.empty(0) for _ in chans]
+    record = 0
+
+    def write(trends):
+        nonlocal record
+        for i, trend in enumerate(trends):
+            if compress:
+                trend = semilog(trend)
+            digital = np.rint((trend - offset[i]) / gain[i])
+            pending[i] = np.concatenate((pending[i], digital))
+
+        n_records = min(len(p) for p in pending) // samples_per_record
+        n_records = min(n_records, out_header.number_of_data_records - record)
+        n_samples = n_records * samples_per_record
+        writer.write_signals(
+            record,
+            [np.clip(p[:n_samples], -32768, 32767).astype(np.int16) for p in pending],
+        )
+        pending[:] = [p[n_samples:] for p in pending]
+        record += n_records
+
+    with ensemble_edf.EdfWriter(fd_out, out_header) as writer:
+        for chunk in chunks:
+            write(
+                [
+                    engine.process(np.ravel(signal))
+                    for engine, signal in zip(engines, chunk, strict=True)
+                ]
+            )
+        write([engine.flush() for engine in engines])
+
+
+def compute_aeeg(
+    fd,
+    fd_out=None,
+    chans=None,
+    trend_fs=TREND_FS,
+    compress=False,
+    chunk_records=ensemble_edf.CHUNK_RECORDS,
+):
+    """
+    Computes the aEEG trend of the signals of an EDF file.
+
+    The recording is streamed in chunks of chunk_records data records, so
+    memory use does not depend on its length.
+
+    Args:
+        fd (str): (Relative) path to the EDF file.
+        fd_out (str, optional): (Relative) path to the trend file. Defaults to
+            None, which appends _aEEG to the filename of fd.
+        chans (list, optional): The indices and/or labels of the signals.
+            Defaults to None, which uses every signal except EDF Annotations.
+        trend_fs (float, optional): The sample rate of the trend. Defaults to
+            TREND_FS.
+        compress (bool, optional): Whether to compress the trend
+            semi-logarithmically, see semilog. Defaults to False.
+        chunk_records (int, optional): The number of data records per chunk.
+            Defaults to ensemble_edf.CHUNK_RECORDS.
+
+    Returns:
+        str: The path to the trend file.
+    """
+    if not os.path.isfile(fd):
+        raise FileNotFoundError(fd)
+    if fd_out is None:
+        fd_out = os.path.splitext(fd)[0] + "_aEEG.edf"
+
+    header = ensemble_edf.read_edf_header(fd)
+    if chans is None:
+        chans = ensemble_edf.get_data_channel_indices(header)
+    chans = ensemble_edf.get_channel_indices(header, chans)
+
+    chunks = ensemble_edf.iter_edf_physical(
+        fd, header, chans, chunk_records=chunk_records
+    )
+    _stream_aeeg(fd_out, header, chans, chunks, trend_fs, compress)
+
+    return fd_out
+
+
+def _iter_brm_physical(header, data, zip_ref, chunk_records):
+    """
+    Yields calibrated chunks of the channels of one BRM segment, cut to the
+    number of data records in header.
+    """
+    gain, offset = ensemble_edf.get_gain_offset(header)
+    streams = [
+        brm_to_edf.iter_numerical_data(
+            channel, zip_ref, chunk_records * channel.sampleHz
+        )
+        for channel in data
+    ]
+    remaining = [header.number_of_data_records * channel.sampleHz for channel in data]
+
+    for chunk in zip(*streams, strict=False):
+        chunk = [x[:n] for x, n in zip(chunk, remaining, strict=True)]
+        remaining = [n - len(x) for x, n in zip(chunk, remaining, strict=True)]
+        yield [g * x + o for x, g, o in zip(chunk, gain, offset, strict=True)]
+
+
+def compute_aeeg_brm(
+    fd,
+    is_fs_64hz=False,
+    trend_fs=TREND_FS,
+    compress=False,
+    chunk_records=brm_to_edf.CHUNK_RECORDS,
+):
+    """
+    Computes the aEEG trend of the left and right channel of a BRM file.
+
+    The raw data is streamed out of the archive, without converting it to
+    EDF first. Every segment is written to its own trend file, named like
+    the output of brm_to_edf.convert_brm_to_edf with _aEEG appended.
+
+    Args:
+        fd (str): The path to the BRM file.
+        is_fs_64hz (bool, optional): Whether to use the 64 Hz instead of the
+            256 Hz data streams. Defaults to False.
+        trend_fs (float, optional): The sample rate of the trend. Defaults to
+            TREND_FS.
+        compress (bool, optional): Whether to compress the trend
+            semi-logarithmically, see semilog. Defaults to False.
+        chunk_records (int, optional): The number of one second data records
+            per chunk. Defaults to brm_to_edf.CHUNK_RECORDS.
+
+    Returns:
+        list: The paths to the trend files.
+    """
+    if not os.path.isfile(fd):
+        raise ValueError("file not found")
+
+    outputs = []
+    with brm_to_edf.open_brm_archive(fd) as (zip_ref, index, device):
+        segments = brm_to_edf.get_dat_files(zip_ref, is_fs_64hz)
+        for i, both_dat_files in enumerate(segments):
+            data = brm_to_edf.extract_brm_file(index, device, both_dat_files, zip_ref)
+            header = ensemble_edf.Header(
+                *brm_to_edf.prepare_edf_header(data),
+                brm_to_edf.prepare_edf_signal_header(data, device),
+            )
+            # prepare_edf_header gives the record duration as the string "1"
+            header = header._replace(
+                duration_of_a_data_record=float(header.duration_of_a_data_record)
+            )
+            chunks = _iter_brm_physical(header, data, zip_ref, chunk_records)
+
+            suffix = "" if i == 0 else f"_{i}"
+            fd_out = os.path.splitext(fd)[0] + suffix + "_aEEG.edf"
+            _stream_aeeg(fd_out, header, [0, 1], chunks, trend_fs, compress)
+            outputs.append(fd_out)
+
+    return outputs
@@ -0,0 +1,297 @@
+import bisect
+import json
+import os
+import warnings
+from collections import namedtuple
+
+import numpy as np
+
+from ensemble_eeg import ensemble_edf
+
+ANNOTATION_LABEL = "EDF Annotations"
+CACHE_SUFFIX = ".annotations.json"
+
+Annotation = namedtuple("Annotation", ["onset", "duration", "text"])
+
+
+def parse_tals(raw):
+    """
+    Decodes the time-stamped annotation lists (TALs) of one data record.
+
+    Every TAL is "+onset[\\x15duration]\\x14text\\x14...\\x14\\x00", the
+    unused bytes of the record are zero.
+
+    Args:
+        raw (bytes): The bytes of an annotation signal in one data record.
+
+    Raises:
+        ValueError: If a TAL has no valid onset or duration.
+
+    Returns:
+        list: One (onset, duration, texts) tuple per TAL, duration is None if
+            it is not given.
+    """
+    tals = []
+    for tal in raw.split(b"\x00"):
+        if not tal:
+            continue
+        fields = tal.split(b"\x14")
+        onset, _, duration = fields[0].partition(b"\x15")
+        if onset[:1] not in (b"+", b"-"):
+            raise ValueError(f"TAL onset {onset!r} does not start with + or -")
+        tals.append(
+            (
+                float(onset),
+                float(duration) if duration else None,
+                [text.decode("utf-8", "replace") for text in fields[1:-1]],
+            )
+        )
+    return tals
+
+
+def read_annotations(fd, header=None, chunk_records=ensemble_edf.CHUNK_RECORDS):
+    """
+    Reads the annotations of an EDF+ file.
+
+    Only the annotation signals are read: they are strided views of the
+    memory-mapped data section, so the samples of the other signals are
+    skipped. The first TAL of every data record holds the onset of the
+    record, the other TALs are annotations, with one Annotation per text.
+
+    Args:
+        fd (str): (Relative) path to the EDF file.
+        header (Header, optional): The header of the file. Defaults to None,
+            which reads it from fd.
+        chunk_records (int, optional): The number of data records read at
+            once. Defaults to ensemble_edf.CHUNK_RECORDS.
+
+    Returns:
+        tuple: The annotations, sorted by onset, and the onset of every data
+            record in seconds (empty if the file has no annotation signal). A
+            record without a valid onset is assumed to directly follow the
+            previous record.
+    """
+    if header is None:
+        header = ensemble_edf.read_edf_header(fd)
+
+    chans = [
+        i for i, signal in enumerate(header.signals) if signal.label == ANNOTATION_LABEL
+    ]
+    annotations = []
+    record_onsets = []
+    if not chans:
+        return annotations, record_onsets
+
+    n_records = header.number_of_data_records
+    data = ensemble_edf.memmap_edf_data(fd, header)
+    views = ensemble_edf.get_signal_views(data, header, chans)
+    n_malformed = 0
+
+    for start in range(0, n_records, chunk_records):
+        stop = min(start + chunk_records, n_records)
+        chunks = [np.ascontiguousarray(view[start:stop]) for view in views]
+        for record in range(stop - start):
+            onset = None
+            for i, chunk in enumerate(chunks):
+                try:
+                    tals = parse_tals(chunk[record].tobytes())
+                except ValueError:
+                    n_malformed += 1
+                    continue
+                # the first TAL of the first annotation signal keeps the time,
+                # its empty text is skipped below
+                if i == 0 and tals:
+                    onset = tals[0][0]
+                annotations.extend(
+                    Annotation(onset, duration, text)
+                    for onset, duration, texts in tals
+                    for text in texts
+                    if text
+                )
+            # a record without a valid onset directly follows the previous one
+            if onset is None:
+                onset = (
+                    record_onsets[-1] + header.duration_of_a_data_record
+                    if record_onsets
+                    else (start + record) * header.duration_of_a_data_record
+                )
+            record_onsets.append(onset)
+
+    assert len(record_onsets) == n_records
+    if n_malformed:
+        warnings.warn(f"{fd}: skipped {n_malformed} malformed annotation records.")
+
+    annotations.sort(key=lambda annotation: annotation.onset)
+    return annotations, record_onsets
+
+
+class AnnotationIndex:
+    """
+    Sorted annotations of an EDF+ file, searchable by time.
+
+    Lookups bisect the sorted onsets, so they take logarithmic time in the
+    number of annotations.
+
+    Args:
+        annotations (list): The annotations, in any order.
+        record_onsets (list, optional): The onset of every data record in
+            seconds, to map onsets to positions in a discontinuous (EDF+D)
+            file. Defaults to None, for a continuous file.
+        start (float, optional): The onset of the first data record of a
+            continuous file. Defaults to 0.
+        duration_of_a_data_record (float, optional): Needed with
+            record_onsets. Defaults to 1.
+    """
+
+    def __init__(
+        self, annotations, record_onsets=None, start=0, duration_of_a_data_record=1
+    ):
+        self.annotations = sorted(
+            (Annotation(*annotation) for annotation in annotations),
+            key=lambda annotation: annotation.onset,
+        )
+        self.onsets = [annotation.onset for annotation in self.annotations]
+        self.record_onsets = record_onsets
+        self.start = start
+        self.duration_of_a_data_record = duration_of_a_data_record
+
+    def __len__(self):
+        return len(self.annotations)
+
+    def __iter__(self):
+        return iter(self.annotations)
+
+    def between(self, start_time, stop_time):
+        """Returns the annotations with start_time <= onset < stop_time."""
+        first = bisect.bisect_left(self.onsets, start_time)
+        last = bisect.bisect_left(self.onsets, stop_time, lo=first)
+        return self.annotations[first:last]
+
+    def nearest(self, time):
+        """Returns the annotation with the onset closest to time, or None."""
+        i = bisect.bisect_left(self.onsets, time)
+        candidates = self.annotations[max(i - 1, 0) : i + 1]
+        return min(candidates, key=lambda a: abs(a.onset - time), default=None)
+
+    def find(self, text):
+        """Returns the annotations with the given text, in order of onset."""
+        return [
+            annotation for annotation in self.annotations if annotation.text == text
+        ]
+
+    def to_file_time(self, onset):
+        """
+        Converts an onset to seconds from the first sample in the file.
+
+        In a discontinuous file, the data record holding onset is looked up
+        by bisecting the record onsets.
+        """
+        if self.record_onsets is None:
+            return onset - self.start
+        record = max(bisect.bisect_right(self.record_onsets, onset) - 1, 0)
+        return (
+            record * self.duration_of_a_data_record + onset - self.record_onsets[record]
+        )
+
+
+def _file_key(fd):
+    stat = os.stat(fd)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _read_cache(cache_path, key):
+    try:
+        with open(cache_path) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (cache.get("size"), cache.get("mtime_ns")) != key:
+        return None
+    return cache
+
+
+def _write_cache(cache_path, cache):
+    try:
+        with open(cache_path + ".tmp", "w") as f:
+            json.dump(cache, f)
+        os.replace(cache_path + ".tmp", cache_path)
+    except OSError as err:
+        warnings.warn(f"Could not write annotation cache {cache_path}: {err}")
+
+
+def load_annotation_index(fd, header=None, cache=True):
+    """
+    Loads the annotations of an EDF+ file into an AnnotationIndex.
+
+    The annotations are cached in <fd>.annotations.json, which is used as
+    long as the size and modification time of fd do not change.
+
+    Args:
+        fd (str): (Relative) path to the EDF file.
+        header (Header, optional): The header of the file. Defaults to None,
+            which reads it from fd if the cache cannot be used.
+        cache (bool, optional): Read and write the cache. Defaults to True.
+
+    Returns:
+        AnnotationIndex: The annotations of fd.
+    """
+    cache_path = fd + CACHE_SUFFIX
+    key = _file_key(fd)
+    cached = _read_cache(cache_path, key) if cache else None
+
+    if cached is None:
+        if header is None:
+            header = ensemble_edf.read_edf_header(fd)
+        annotations, record_onsets = read_annotations(fd, header)
+        duration = header.duration_of_a_data_record
+        start = record_onsets[0] if record_onsets else 0
+        # continuous files do not need the onset of every data record
+        if np.allclose(record_onsets, start + duration * np.arange(len(record_onsets))):
+            record_onsets = None
+        cached = {
+            "size": key[0],
+            "mtime_ns": key[1],
+            "start": start,
+            "duration_of_a_data_record": duration,
+            "record_onsets": record_onsets,
+            "annotations": [list(annotation) for annotation in annotations],
+        }
+        if cache:
+            _write_cache(cache_path, cached)
+
+    return AnnotationIndex(
+        cached["annotations"],
+        cached["record_onsets"],
+        cached["start"],
+        cached["duration_of_a_data_record"],
+    )
+
+
+def read_event_windows(fd, header, index, text, before, after, chans="all"):
+    """
+    Reads a time window around every annotation with a given text.
+
+    The annotations are looked up in the index and every window is read with
+    ensemble_edf.read_edf_window, which only maps the data records covering
+    it, so no part of the file outside the windows is read.
+
+    Args:
+        fd (str): (Relative) path to the EDF file.
+        header (Header): The header of the file.
+        index (AnnotationIndex): The annotations of the file, see
+            load_annotation_index.
+        text (str): The text of the annotations.
+        before (float): Seconds before every onset.
+        after (float): Seconds after every onset.
+        chans (str or list, optional): The indices and/or labels of the
+            signals to read. Defaults to "all".
+
+    Yields:
+        tuple: The annotation and the window, one array per selected signal.
+    """
+    for annotation in index.find(text):
+        start_time = index.to_file_time(annotation.onset) - before
+        yield (
+            annotation,
+            ensemble_edf.read_edf_window(fd, header, start_time, before + after, chans),
+        )
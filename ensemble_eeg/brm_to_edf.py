@@ -1,23 +1,49 @@
-import glob
+import contextlib
+import fnmatch
 import os
-import shutil
+import queue
+import threading
+import time
+import warnings
 import zipfile
 from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
 
-import defusedxml.ElementTree as ET
 import numpy as np
 
 from ensemble_eeg import ensemble_edf
 
+CHUNK_RECORDS = 3600
+QUEUE_SIZE = 2
+GAP_MODES = ("pad", "discontinuous")
+# FileDescription fields that may hold the start of a data stream
+SEGMENT_START_FIELDS = (
+    "StartTime",
+    "StartTimeUTC",
+    "StartDateTime",
+    "RecordingStartTime",
+)
+ANNOTATION_SAMPLES = 16
 
-def convert_brm_to_edf(fd, is_fs_64hz=None):
+
+def convert_brm_to_edf(fd, is_fs_64hz=None, stitch=False, gaps="pad"):
     """
     Converts a BRM file to EDF format.
 
+    The data streams are read directly from the BRM archive in chunks of
+    CHUNK_RECORDS data records, so nothing is extracted to disk and memory
+    use does not depend on the length of the recording.
+
     Parameters:
         fd (str): The path to the BRM file.
         is_fs_64hz (bool, optional): Indicates whether the sampling frequency
             is 64 Hz. Defaults to None.
+        stitch (bool, optional): Write all segments to a single EDF file, see
+            write_stitched_brm, instead of one EDF file per segment. Defaults
+            to False.
+        gaps (str, optional): How gaps between stitched segments are written,
+            "pad" or "discontinuous". Defaults to "pad".
 
     Raises:
         ValueError: If the file is not found.
@@ -29,72 +55,468 @@ def convert_brm_to_edf(fd, is_fs_64hz=None):
     file_exists = os.path.isfile(fd)
 
     if file_exists:
-        file_dir = os.path.dirname(fd)
-        tmp_dir = os.path.join(file_dir, "tmp")
-        if os.path.isdir(tmp_dir):
-            shutil.rmtree(tmp_dir)
-
         print(f"{filename}")
-        print("\tUnzipping to temporary directory")
-        with zipfile.ZipFile(fd, "r") as zip_ref:
-            zip_ref.extractall(tmp_dir)
-
-        index_xml = os.path.join(tmp_dir, "BRM_Index.xml")
-        index = parse_xml(index_xml)
-        device_xml = os.path.join(tmp_dir, "Device.xml")
-        device = parse_xml(device_xml)
-
-        if is_fs_64hz is None:
-            is_fs_64hz = (
-                input("is the sampling frequency 64 Hz? [y/N]: ").lower() == "y"
-            )
+        with open_brm_archive(fd) as (zip_ref, index, device):
+            if is_fs_64hz is None:
+                is_fs_64hz = (
+                    input("is the sampling frequency 64 Hz? [y/N]: ").lower() == "y"
+                )
 
-        if is_fs_64hz:
-            dat_files_left = sorted(
-                glob.glob(os.path.join(tmp_dir, "DATA_RAW_EEG_LEFT*.dat"))
-            )
-            dat_files_right = sorted(
-                glob.glob(os.path.join(tmp_dir, "DATA_RAW_EEG_RIGHT*.dat"))
-            )
+            segments = get_dat_files(zip_ref, is_fs_64hz)
+
+            if stitch:
+                write_stitched_brm(fd, index, device, segments, zip_ref, gaps)
+                return
+
+            for i, both_dat_files in enumerate(segments):
+                write_brm_segment(fd, i, index, device, both_dat_files, zip_ref)
+    else:
+        raise ValueError("file not found")
+
+
+@contextlib.contextmanager
+def open_brm_archive(fd):
+    """
+    Opens a BRM archive and parses its BRM_Index.xml and Device.xml.
+
+    Parameters:
+        fd (str): The path to the BRM file.
+
+    Yields:
+        tuple: The opened archive (zipfile.ZipFile), the parsed BRM_Index.xml
+            and the parsed Device.xml.
+    """
+    with zipfile.ZipFile(fd, "r") as zip_ref:
+        with zip_ref.open("BRM_Index.xml") as index_xml:
+            index = parse_xml(index_xml)
+        with zip_ref.open("Device.xml") as device_xml:
+            device = parse_xml(device_xml)
+        yield zip_ref, index, device
+
+
+def get_segment_filename(fd, i):
+    """
+    Returns the name of the EDF file of segment i of a BRM file.
+
+    Parameters:
+        fd (str): The path to the BRM file.
+        i (int): The index of the segment.
+
+    Returns:
+        str: The path of the EDF file, without suffix for the first segment.
+    """
+    if i == 0:
+        return os.path.splitext(fd)[0] + ".edf"
+    return os.path.splitext(fd)[0] + "_" + str(i) + ".edf"
+
+
+def write_brm_segment(fd, i, index, device, both_dat_files, zip_ref):
+    """
+    Converts one segment of an opened BRM file to EDF.
+
+    Parameters:
+        fd (str): The path to the BRM file.
+        i (int): The index of the segment.
+        index (Index): The parsed BRM_Index.xml.
+        device (Device): The parsed Device.xml.
+        both_dat_files (list): The left and right data stream of the segment.
+        zip_ref (zipfile.ZipFile): The opened BRM archive.
+
+    Returns:
+        str: The path of the EDF file.
+    """
+    data = extract_brm_file(index, device, both_dat_files, zip_ref)
+    output_filename = get_segment_filename(fd, i)
+
+    hdr = prepare_edf_header(data)
+    signal_header = prepare_edf_signal_header(data, device)
+    header = ensemble_edf.Header(*hdr, signal_header)
+
+    # write header to file
+    print(f"\tprint header to {output_filename}")
+    ensemble_edf.write_edf_header(output_filename, header)
+
+    # write data to file
+    print(f"\tprint data records to {output_filename}")
+    write_brm_data_to_edf(output_filename, data, zip_ref)
+
+    return output_filename
 
-        else:
-            dat_files_left = sorted(
-                glob.glob(os.path.join(tmp_dir, "DATA_RAW_EEG_ELECTRODE_LEFT*.dat"))
+
+def convert_brm_segment(fd, i, both_dat_files):
+    """
+    Converts one segment of a BRM file to EDF, opening the archive itself so
+    that segments can be converted in separate processes.
+
+    Parameters:
+        fd (str): The path to the BRM file.
+        i (int): The index of the segment.
+        both_dat_files (list): The left and right data stream of the segment.
+
+    Returns:
+        tuple: The path of the EDF file, its size in bytes and the time the
+            conversion took in seconds.
+    """
+    start = time.perf_counter()
+    with open_brm_archive(fd) as (zip_ref, index, device):
+        output_filename = write_brm_segment(
+            fd, i, index, device, both_dat_files, zip_ref
+        )
+
+    return (
+        output_filename,
+        os.path.getsize(output_filename),
+        time.perf_counter() - start,
+    )
+
+
+def get_segment_onsets(segments):
+    """
+    Returns the onset of every segment of a BRM file.
+
+    The onsets are taken from the start time of the first data stream of
+    every segment in BRM_Index.xml, see SEGMENT_START_FIELDS. If a segment
+    has no start time, the segments are assumed to follow each other
+    without gaps.
+
+    Parameters:
+        segments (list): The data objects of every segment, see
+            extract_brm_file.
+
+    Raises:
+        ValueError: If a segment starts more than one second before the
+            previous segment ends.
+
+    Returns:
+        list: The onset of every segment in seconds after the start of the
+            first segment.
+    """
+    starts = []
+    for data in segments:
+        fields = data[0]._asdict()
+        start = next(
+            (fields[name] for name in SEGMENT_START_FIELDS if fields.get(name)), None
+        )
+        try:
+            # datetime.fromisoformat only accepts Z from Python 3.11
+            starts.append(datetime.fromisoformat(start.strip().replace("Z", "+00:00")))
+        except (AttributeError, ValueError):
+            starts = None
+            break
+
+    n_records = [get_number_of_records(data) for data in segments]
+    if starts is None:
+        if len(segments) > 1:
+            warnings.warn(
+                "BRM_Index.xml has no start time for every segment, "
+                "stitching the segments without gaps"
             )
-            dat_files_right = sorted(
-                glob.glob(os.path.join(tmp_dir, "DATA_RAW_EEG_ELECTRODE_RIGHT*.dat"))
+        return [float(sum(n_records[:i])) for i in range(len(segments))]
+
+    onsets = [(start - starts[0]).total_seconds() for start in starts]
+    for i in range(1, len(onsets)):
+        end = onsets[i - 1] + n_records[i - 1]
+        if onsets[i] < end - 1:
+            raise ValueError(
+                f"Segment {i} starts {end - onsets[i]:.3f} s before segment "
+                f"{i - 1} ends"
             )
+        onsets[i] = max(onsets[i], end)
+    return onsets
 
-        n_data_files_left = len(dat_files_left)
-        n_data_files_right = len(dat_files_right)
 
-        assert n_data_files_left == n_data_files_right
+def _annotation_records(onsets):
+    """Encodes one timekeeping TAL per data record as an EDF Annotations signal."""
+    n_bytes = ANNOTATION_SAMPLES * ensemble_edf.INT_SIZE
+    tals = (
+        (f"{onset:+.3f}".rstrip("0").rstrip(".") + "\x14\x14").encode("ascii")
+        for onset in onsets
+    )
+    raw = b"".join(tal.ljust(n_bytes, b"\x00") for tal in tals)
+    return np.frombuffer(raw, dtype=ensemble_edf.EDF_DTYPE).reshape(
+        -1, ANNOTATION_SAMPLES
+    )
+
 
-        for i in range(n_data_files_left):
-            both_dat_files = [dat_files_left[i], dat_files_right[i]]
-            data = extract_brm_file(index, device, both_dat_files)
+def iter_stitched_records(segments, onsets, zip_ref, gaps, chunk_records=CHUNK_RECORDS):
+    """
+    Reads all segments of a BRM file as one sequence of EDF data records.
 
-            if i == 0:
-                output_filename = os.path.splitext(fd)[0] + ".edf"
-            else:
-                output_filename = os.path.splitext(fd)[0] + "_" + str(i) + ".edf"
+    Parameters:
+        segments (list): The data objects of every segment.
+        onsets (list): The onset of every segment in seconds, see
+            get_segment_onsets.
+        zip_ref (zipfile.ZipFile): The opened BRM archive containing the data.
+        gaps (str): "pad" fills the gaps between segments with zero data
+            records, rounded to whole seconds. "discontinuous" appends an EDF
+            Annotations signal holding the onset of every data record.
+        chunk_records (int, optional): The number of data records read from
+            the archive at once. Defaults to CHUNK_RECORDS.
+
+    Yields:
+        np.ndarray: The next chunk of at most chunk_records data records.
+    """
+    record_length = sum(channel.sampleHz for channel in segments[0])
+    position = 0
+    for data, onset in zip(segments, onsets, strict=True):
+        if gaps == "pad":
+            start = max(round(onset), position)
+            for gap_start in range(position, start, chunk_records):
+                n_records = min(chunk_records, start - gap_start)
+                yield np.zeros((n_records, record_length), dtype=ensemble_edf.EDF_DTYPE)
+            position = start
+
+        offset = 0
+        for records in iter_brm_records(data, zip_ref, chunk_records):
+            if gaps == "discontinuous":
+                tals = _annotation_records(onset + offset + np.arange(len(records)))
+                records = np.concatenate((records, tals), axis=1)
+            offset += len(records)
+            yield records
+        position += offset
+
+
+def write_stitched_brm(
+    fd,
+    index,
+    device,
+    segments,
+    zip_ref,
+    gaps="pad",
+    fd_out=None,
+    chunk_records=CHUNK_RECORDS,
+):
+    """
+    Converts all segments of an opened BRM file to a single EDF file.
 
-            hdr = prepare_edf_header(data)
-            signal_header = prepare_edf_signal_header(data, device)
-            header = ensemble_edf.Header(*hdr, signal_header)
+    The number of data records of every segment follows from the size of its
+    data streams, so the header is written once and the data records of all
+    segments are streamed in order behind it.
 
-            # write header to file
-            print(f"\tprint header to {output_filename}")
-            ensemble_edf.write_edf_header(output_filename, header)
+    Parameters:
+        fd (str): The path to the BRM file.
+        index (Index): The parsed BRM_Index.xml.
+        device (Device): The parsed Device.xml.
+        segments (list): The left and right data stream of every segment, see
+            get_dat_files.
+        zip_ref (zipfile.ZipFile): The opened BRM archive.
+        gaps (str, optional): "pad" writes a continuous EDF file in which the
+            gaps between segments are filled with zeros. "discontinuous"
+            writes an EDF+D file without the gaps, whose EDF Annotations
+            signal holds the onset of every data record. Defaults to "pad".
+        fd_out (str, optional): The path of the EDF file. Defaults to None,
+            which uses the name of the first segment, see
+            get_segment_filename.
+        chunk_records (int, optional): The number of data records read from
+            the archive at once. Defaults to CHUNK_RECORDS.
 
-            # write data to file
-            print(f"\tprint data records to {output_filename}")
-            write_brm_data_to_edf(output_filename, data)
+    Raises:
+        ValueError: If gaps is unknown, if there are no segments, or if the
+            segments do not have the same sample rates.
 
-        print("\tremoving temporary directory")
-        shutil.rmtree(tmp_dir)
+    Returns:
+        str: The path of the EDF file.
+    """
+    if gaps not in GAP_MODES:
+        raise ValueError(f"gaps must be one of {GAP_MODES}, not {gaps}")
+    if not segments:
+        raise ValueError(f"{fd} has no data streams")
+
+    data = [
+        extract_brm_file(index, device, both_dat_files, zip_ref)
+        for both_dat_files in segments
+    ]
+    sample_rates = {tuple(channel.sampleHz for channel in d) for d in data}
+    if len(sample_rates) != 1:
+        raise ValueError(f"Segments have different sample rates: {sample_rates}")
+
+    onsets = get_segment_onsets(data)
+    n_records = [get_number_of_records(d) for d in data]
+    if fd_out is None:
+        fd_out = get_segment_filename(fd, 0)
+
+    hdr = prepare_edf_header(data[0])
+    signal_header = prepare_edf_signal_header(data[0], device)
+    header = ensemble_edf.Header(*hdr, signal_header)
+    if gaps == "pad":
+        padded = 0
+        for onset, n in zip(onsets, n_records, strict=True):
+            padded = max(round(onset), padded) + n
+        header = header._replace(number_of_data_records=padded)
     else:
-        raise ValueError("file not found")
+        signal_header += (
+            ensemble_edf.SignalHeader(
+                "EDF Annotations",
+                None,
+                None,
+                -1,
+                1,
+                -(2**15),
+                2**15 - 1,
+                None,
+                ANNOTATION_SAMPLES,
+                None,
+            ),
+        )
+        header = header._replace(
+            number_of_bytes_in_header_record=ensemble_edf.HEADER_SIZE
+            + len(signal_header) * ensemble_edf.SIGNAL_HEADER_SIZE,
+            reserved="EDF+D",
+            number_of_data_records=sum(n_records),
+            number_of_signals=len(signal_header),
+            signals=signal_header,
+        )
+
+    print(f"\tprint header to {fd_out}")
+    ensemble_edf.write_edf_header(fd_out, header)
+
+    print(f"\tprint data records of {len(segments)} segments to {fd_out}")
+    _write_records(
+        fd_out, iter_stitched_records(data, onsets, zip_ref, gaps, chunk_records)
+    )
+
+    return fd_out
+
+
+def convert_brm_stitched(fd, is_fs_64hz=False, gaps="pad"):
+    """
+    Converts all segments of a BRM file to a single EDF file, opening the
+    archive itself so that files can be converted in separate processes.
+
+    Parameters:
+        fd (str): The path to the BRM file.
+        is_fs_64hz (bool, optional): Whether to convert the 64 Hz instead of
+            the 256 Hz data streams. Defaults to False.
+        gaps (str, optional): See write_stitched_brm. Defaults to "pad".
+
+    Returns:
+        tuple: The path of the EDF file, its size in bytes and the time the
+            conversion took in seconds.
+    """
+    start = time.perf_counter()
+    with open_brm_archive(fd) as (zip_ref, index, device):
+        segments = get_dat_files(zip_ref, is_fs_64hz)
+        output_filename = write_stitched_brm(fd, index, device, segments, zip_ref, gaps)
+
+    return (
+        output_filename,
+        os.path.getsize(output_filename),
+        time.perf_counter() - start,
+    )
+
+
+def convert_brm_directory(
+    input_dir, is_fs_64hz=False, jobs=None, stitch=False, gaps="pad"
+):
+    """
+    Converts all BRM files in a directory to EDF in parallel.
+
+    The segments of all files are converted by one pool of worker processes,
+    so a long archive with several segments is spread over several workers
+    as well. Within a worker, reading and decompressing the data overlaps
+    with writing it, see write_brm_data_to_edf.
+
+    Parameters:
+        input_dir (str): The directory with the BRM files.
+        is_fs_64hz (bool, optional): Whether to convert the 64 Hz instead of
+            the 256 Hz data streams. Defaults to False.
+        jobs (int, optional): The number of worker processes. Defaults to
+            None, which uses one worker per CPU.
+        stitch (bool, optional): Write all segments of a file to a single EDF
+            file, see write_stitched_brm. Every file is then converted by a
+            single worker. Defaults to False.
+        gaps (str, optional): See write_stitched_brm. Defaults to "pad".
+
+    Returns:
+        dict: Summary of the batch: the number of files, the files that
+            failed with their error message, the elapsed time, and per file
+            the EDF files written, their size and the conversion time.
+    """
+    if not os.path.isdir(input_dir):
+        raise ValueError(f"{input_dir} is not a directory")
+
+    brm_files = sorted(
+        os.path.join(input_dir, name)
+        for name in os.listdir(input_dir)
+        if name.lower().endswith(".brm")
+    )
+
+    start = time.perf_counter()
+    files = {fd: {"edf_files": [], "bytes": 0, "seconds": 0.0} for fd in brm_files}
+    failed = {}
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {}
+        for fd in brm_files:
+            if stitch:
+                future = executor.submit(convert_brm_stitched, fd, is_fs_64hz, gaps)
+                futures[future] = fd
+                continue
+            try:
+                with zipfile.ZipFile(fd, "r") as zip_ref:
+                    segments = get_dat_files(zip_ref, is_fs_64hz)
+            except (OSError, zipfile.BadZipFile, AssertionError) as err:
+                failed[fd] = repr(err)
+                continue
+            for i, both_dat_files in enumerate(segments):
+                future = executor.submit(convert_brm_segment, fd, i, both_dat_files)
+                futures[future] = fd
+
+        for future in as_completed(futures):
+            fd = futures[future]
+            try:
+                output_filename, n_bytes, seconds = future.result()
+            except Exception as err:  # noqa: BLE001
+                failed[fd] = repr(err)
+                continue
+            files[fd]["edf_files"].append(output_filename)
+            files[fd]["bytes"] += n_bytes
+            files[fd]["seconds"] += seconds
+
+    for fd in failed:
+        files.pop(fd, None)
+    for fd, result in files.items():
+        result["edf_files"].sort()
+        result["seconds"] = round(result["seconds"], 3)
+        print(f"converted {fd} in {result['seconds']} s")
+
+    return {
+        "files": len(brm_files),
+        "succeeded": len(files),
+        "failed": failed,
+        "seconds": round(time.perf_counter() - start, 3),
+        "converted": files,
+    }
+
+
+def get_dat_files(zip_ref, is_fs_64hz):
+    """
+    Pairs the left and right data streams of every segment of a BRM archive.
+
+    Parameters:
+        zip_ref (zipfile.ZipFile): The opened BRM archive.
+        is_fs_64hz (bool): Whether to use the 64 Hz instead of the 256 Hz
+            data streams.
+
+    Returns:
+        list: One [left, right] pair of member names per segment.
+    """
+    members = zip_ref.namelist()
+    if is_fs_64hz:
+        dat_files_left = sorted(fnmatch.filter(members, "DATA_RAW_EEG_LEFT*.dat"))
+        dat_files_right = sorted(fnmatch.filter(members, "DATA_RAW_EEG_RIGHT*.dat"))
+
+    else:
+        dat_files_left = sorted(
+            fnmatch.filter(members, "DATA_RAW_EEG_ELECTRODE_LEFT*.dat")
+        )
+        dat_files_right = sorted(
+            fnmatch.filter(members, "DATA_RAW_EEG_ELECTRODE_RIGHT*.dat")
+        )
+
+    assert len(dat_files_left) == len(dat_files_right)
+
+    return [list(pair) for pair in zip(dat_files_left, dat_files_right, strict=True)]
 
 
 def parse_xml(xml):
@@ -102,7 +524,8 @@ def parse_xml(xml):
     Parse an XML file and return a named tuple representing the parsed XML.
 
     Parameters:
-        xml (str): The path to the XML file to be parsed.
+        xml (str or file-like object): The path to the XML file to be parsed,
+            or an open XML file.
 
     Returns:
         Parsed_XML: A named tuple representing the parsed XML. The fields of the
@@ -122,9 +545,11 @@ def parse_xml(xml):
         >>> parse_xml('data.xml')
         Parsed_XML(tag_names=['tag1', 'tag2'], tag1='text1', tag2=[Tag2(tag3='text3', tag4='text4')])
     """
-    file_exists = os.path.isfile(xml)
+    file_exists = not isinstance(xml, str) or os.path.isfile(xml)
 
     if file_exists:
+        import defusedxml.ElementTree as ET
+
         tree = ET.parse(xml)
         root = tree.getroot()
 
@@ -156,7 +581,7 @@ def parse_xml(xml):
     return Parsed_XML(*parsed_xml)
 
 
-def extract_brm_file(index, device, dat_files):
+def extract_brm_file(index, device, dat_files, zip_ref):
     """
     Extracts data from BRM files based on the given index, device, and dat_files.
 
@@ -164,6 +589,7 @@ def extract_brm_file(index, device, dat_files):
         index (Index): The index object containing file descriptions.
         device (Device): The device to extract data for.
         dat_files (List[str]): The list of dat files to extract data from.
+        zip_ref (zipfile.ZipFile): The opened BRM archive containing dat_files.
 
     Returns:
         List[List[Data]]: A list of data extracted from BRM files.
@@ -177,60 +603,85 @@ def extract_brm_file(index, device, dat_files):
         file = index.FileDescription[filenames.index(df)]
         file = file._replace(FileName=dat_file)
         print(f"\textracting {df} datastream")
-        data[i] = get_brm_data(file, device)
+        data[i] = get_brm_data(file, device, zip_ref)
 
     return data
 
 
-def get_brm_data(file, device):
+def get_brm_data(file, device, zip_ref):
     """
-    Generates a named tuple containing the data from the given file and device.
+    Generates a named tuple describing the data from the given file and device.
 
     Parameters:
         file (namedtuple): The file containing the data.
         device (str): The device associated with the data.
+        zip_ref (zipfile.ZipFile): The opened BRM archive containing the file.
 
     Returns:
-        Data: A named tuple containing the data from the file, the sample rate, and the numerical data.
+        Data: A named tuple containing the file description, the sample rate,
+            and the number of samples in the file. The samples themselves are
+            read with iter_numerical_data.
     """
     DAUSampleHz = 512
 
-    Data = namedtuple("data", list(file._fields) + ["sampleHz", "data"])
+    Data = namedtuple("data", list(file._fields) + ["sampleHz", "n_samples"])
+    dtype = get_numerical_dtype(file)
     data = list(file)
     data.extend(
         (
             int(DAUSampleHz / int(file.SamplePeriod512thSeconds)),
-            get_numerical_data(file, device),
+            zip_ref.getinfo(file.FileName).file_size // dtype.itemsize,
         )
     )
 
     return Data(*data)
 
 
-def get_numerical_data(file, device):
+def get_numerical_dtype(file):
     """
-    Reads numerical data from a file and returns it.
+    Returns the data type of the numerical data in a file.
 
     Parameters:
         file (File): The file object representing the file to read from.
-        device (str): The device to use for reading the file.
 
     Returns:
-        np.ndarray: The numerical data read from the file.
+        np.dtype: The data type of the samples.
 
     Raises:
         Exception: If the file format is unrecognized.
     """
-    f = open(file.FileName, "rb")
-
     if file.FileType in {"FloatMappedToInt16", "Int16"}:
-        data = np.fromfile(f, dtype=np.int16)
+        return np.dtype(np.int16)
     elif file.FileType == "Float32":
-        data = np.fromfile(f, dtype=np.float32)
+        return np.dtype(np.float32)
     else:
         raise Exception(f"Unrecognized file format {file.FileType}")
 
-    return data
+
+def iter_numerical_data(file, zip_ref, chunk_size):
+    """
+    Reads numerical data from a file in the BRM archive in chunks.
+
+    Parameters:
+        file (File): The file object representing the file to read from.
+        zip_ref (zipfile.ZipFile): The opened BRM archive containing the file.
+        chunk_size (int): The number of samples per chunk.
+
+    Yields:
+        np.ndarray: The next chunk_size samples, or less for the last chunk.
+
+    Raises:
+        Exception: If the file format is unrecognized.
+    """
+    dtype = get_numerical_dtype(file)
+
+    with zip_ref.open(file.FileName) as f:
+        while True:
+            buffer = f.read(chunk_size * dtype.itemsize)
+            n_samples = len(buffer) // dtype.itemsize
+            if n_samples == 0:
+                break
+            yield np.frombuffer(buffer, dtype=dtype, count=n_samples)
 
 
 def prepare_edf_header(data):
@@ -264,8 +715,7 @@ def prepare_edf_header(data):
         ensemble_edf.HEADER_SIZE + n_channels * ensemble_edf.SIGNAL_HEADER_SIZE
     )
     reserved = None
-    fs = data[0].sampleHz
-    n_records = int(np.floor(len(data[0].data) / fs))
+    n_records = get_number_of_records(data)
     dur_data_record = "1"
     n_signals = len(data)
     header = [
@@ -337,30 +787,117 @@ def prepare_edf_signal_header(data, device):
     return tuple(signal_headers)
 
 
-def write_brm_data_to_edf(filename, data):
+def iter_brm_records(data, zip_ref, chunk_records=CHUNK_RECORDS):
+    """
+    Reads the channels of a BRM segment as interleaved EDF data records.
+
+    Args:
+        data (list): A list of data objects.
+        zip_ref (zipfile.ZipFile): The opened BRM archive containing the data.
+        chunk_records (int, optional): The number of data records read from
+            the archive at once. Defaults to CHUNK_RECORDS.
+
+    Yields:
+        np.ndarray: The next chunk of at most chunk_records data records.
+    """
+    samples_per_record = [channel.sampleHz for channel in data]
+    n_records = get_number_of_records(data)
+    streams = [
+        iter_numerical_data(channel, zip_ref, chunk_records * channel.sampleHz)
+        for channel in data
+    ]
+
+    for chunks in zip(*streams, strict=False):
+        if n_records == 0:
+            break
+        records = ensemble_edf.interleave_signals(chunks, samples_per_record)
+        yield records[:n_records]
+        n_records -= min(len(records), n_records)
+
+
+def _read_ahead(records, buffer, stop):
+    """
+    Puts every chunk of records in buffer, followed by None or the error,
+    until stop is set.
+    """
+    try:
+        for chunk in records:
+            if stop.is_set():
+                return
+            buffer.put(chunk)
+    except Exception as err:  # noqa: BLE001
+        buffer.put(err)
+    else:
+        buffer.put(None)
+
+
+def write_brm_data_to_edf(
+    filename, data, zip_ref, chunk_records=CHUNK_RECORDS, queue_size=QUEUE_SIZE
+):
     """
     Write BRM data to EDF file.
 
+    The channels are read in chunks of chunk_records data records, which are
+    interleaved in a single operation and written with one call per chunk.
+    Reading runs in a separate thread that stays at most queue_size chunks
+    ahead, so decompressing the next chunk overlaps with writing the
+    previous one while memory use stays bounded.
+
     Args:
         filename (str): The name of the file to write the data to.
         data (list): A list of data objects.
+        zip_ref (zipfile.ZipFile): The opened BRM archive containing the data.
+        chunk_records (int, optional): The number of data records read from
+            the archive at once. Defaults to CHUNK_RECORDS.
+        queue_size (int, optional): The number of chunks read ahead. Defaults
+            to QUEUE_SIZE.
 
     Returns:
         None
     """
     file_exists = os.path.isfile(filename)
-    dat1 = data[0].data
-    dat2 = data[1].data
 
     if file_exists:
-        fs = data[0].sampleHz
-        n_records = int(np.floor(len(data[0].data) / fs))
-        fd = open(filename, "ab")
+        _write_records(
+            filename, iter_brm_records(data, zip_ref, chunk_records), queue_size
+        )
 
-        index = 0
-        for i_record in range(n_records):
-            fd.write(dat1[index : (index + fs)])
-            fd.write(dat2[index : (index + fs)])
-            index = (i_record + 1) * fs
 
-        fd.close()
+def _write_records(filename, records, queue_size=QUEUE_SIZE):
+    """
+    Appends chunks of data records to filename, while a separate thread reads
+    at most queue_size chunks ahead.
+    """
+    buffer = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    reader = threading.Thread(
+        target=_read_ahead, args=(records, buffer, stop), daemon=True
+    )
+    reader.start()
+
+    try:
+        with open(filename, "ab") as fd:
+            while (chunk := buffer.get()) is not None:
+                if isinstance(chunk, Exception):
+                    raise chunk
+                chunk.tofile(fd)
+    finally:
+        # unblock the reader if writing failed
+        stop.set()
+        while reader.is_alive():
+            with contextlib.suppress(queue.Empty):
+                buffer.get(timeout=0.1)
+        reader.join()
+
+
+def get_number_of_records(data):
+    """
+    Returns the number of whole one second data records in all channels.
+
+    Args:
+        data (list): A list of data objects.
+
+    Returns:
+        int: The number of data records.
+    """
+    return min(channel.n_samples // channel.sampleHz for channel in data)
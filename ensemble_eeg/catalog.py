@@ -0,0 +1,317 @@
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+from ensemble_eeg import ensemble_edf
+
+CATALOG_FILENAME = "edf_catalog.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    version TEXT,
+    startdate_of_recording TEXT,
+    starttime_of_recording TEXT,
+    number_of_bytes_in_header_record INTEGER,
+    number_of_data_records INTEGER,
+    duration_of_a_data_record REAL,
+    number_of_signals INTEGER,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS signals (
+    path TEXT NOT NULL REFERENCES files (path) ON DELETE CASCADE,
+    signal_index INTEGER NOT NULL,
+    label TEXT,
+    transducer_type TEXT,
+    physical_dimension TEXT,
+    physical_minimum REAL,
+    physical_maximum REAL,
+    digital_minimum INTEGER,
+    digital_maximum INTEGER,
+    prefiltering TEXT,
+    nr_of_samples_in_each_data_record INTEGER,
+    sample_rate REAL,
+    PRIMARY KEY (path, signal_index)
+);
+CREATE INDEX IF NOT EXISTS signals_label ON signals (label);
+"""
+
+# patient and recording identification are never stored in the catalog
+FILE_FIELDS = (
+    "version",
+    "startdate_of_recording",
+    "starttime_of_recording",
+    "number_of_bytes_in_header_record",
+    "number_of_data_records",
+    "duration_of_a_data_record",
+    "number_of_signals",
+)
+SIGNAL_FIELDS = tuple(
+    name for name, _, _ in ensemble_edf.SIGNAL_HEADER if name != "reserved"
+)
+
+
+def connect_catalog(db_path):
+    """
+    Opens (and if needed creates) an EDF header catalog.
+
+    Args:
+        db_path (str): Path to the SQLite catalog.
+
+    Returns:
+        sqlite3.Connection: The connection to the catalog.
+    """
+    connection = sqlite3.connect(db_path)
+    connection.execute("PRAGMA foreign_keys = ON")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def scan_edf_files(directory):
+    """
+    Walks a directory tree and yields every EDF file in it.
+
+    Args:
+        directory (str): The root of the tree.
+
+    Yields:
+        tuple: The absolute path, size and modification time in ns of a file.
+    """
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from scan_edf_files(entry.path)
+            elif entry.is_file() and entry.name.lower().endswith(".edf"):
+                stat = entry.stat()
+                yield os.path.abspath(entry.path), stat.st_size, stat.st_mtime_ns
+
+
+def _read_header(path):
+    try:
+        return ensemble_edf.read_edf_header(path), None
+    except (OSError, ValueError, TypeError) as err:
+        return None, repr(err)
+
+
+def _store_header(connection, path, size, mtime_ns, header, error):
+    connection.execute("DELETE FROM files WHERE path = ?", (path,))
+    if header is None:
+        connection.execute(
+            "INSERT INTO files (path, size, mtime_ns, error) VALUES (?, ?, ?, ?)",
+            (path, size, mtime_ns, error),
+        )
+        return
+
+    connection.execute(
+        f"INSERT INTO files (path, size, mtime_ns, {', '.join(FILE_FIELDS)}) "
+        f"VALUES (?, ?, ?{', ?' * len(FILE_FIELDS)})",
+        (path, size, mtime_ns, *(getattr(header, name) for name in FILE_FIELDS)),
+    )
+    connection.executemany(
+        f"INSERT INTO signals (path, signal_index, {', '.join(SIGNAL_FIELDS)}, "
+        f"sample_rate) VALUES (?, ?{', ?' * len(SIGNAL_FIELDS)}, ?)",
+        [
+            (
+                path,
+                i,
+                *(getattr(signal, name) for name in SIGNAL_FIELDS),
+                signal.nr_of_samples_in_each_data_record
+                / header.duration_of_a_data_record
+                if header.duration_of_a_data_record
+                else None,
+            )
+            for i, signal in enumerate(header.signals)
+        ],
+    )
+
+
+def _store_headers(connection, files, headers):
+    n_failed = 0
+    for (path, size, mtime_ns), (header, error) in zip(files, headers, strict=True):
+        _store_header(connection, path, size, mtime_ns, header, error)
+        n_failed += error is not None
+    return n_failed
+
+
+def build_catalog(directory, db_path=None, jobs=None):
+    """
+    Builds or updates a catalog of the headers of all EDF files in a tree.
+
+    Files whose size and modification time did not change since the last
+    scan are skipped, the headers of new or changed files are parsed in
+    parallel, and files that disappeared are removed from the catalog.
+
+    Args:
+        directory (str): The root of the tree to scan.
+        db_path (str, optional): Path to the SQLite catalog. Defaults to
+            CATALOG_FILENAME in directory.
+        jobs (int, optional): Number of worker processes parsing headers.
+            Defaults to None, which uses one worker per CPU. Use 1 to parse
+            the headers in this process.
+
+    Returns:
+        dict: The number of files found, (re)parsed, failed and removed.
+    """
+    if db_path is None:
+        db_path = os.path.join(directory, CATALOG_FILENAME)
+
+    connection = connect_catalog(db_path)
+    known = {
+        path: (size, mtime_ns)
+        for path, size, mtime_ns in connection.execute(
+            "SELECT path, size, mtime_ns FROM files"
+        )
+    }
+
+    found = list(scan_edf_files(directory))
+    changed = [
+        (path, size, mtime_ns)
+        for path, size, mtime_ns in found
+        if known.get(path) != (size, mtime_ns)
+    ]
+    paths = [path for path, _, _ in changed]
+
+    with connection:
+        if jobs == 1 or len(paths) < 2:
+            n_failed = _store_headers(connection, changed, map(_read_header, paths))
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                headers = executor.map(_read_header, paths, chunksize=64)
+                n_failed = _store_headers(connection, changed, headers)
+
+        removed = set(known) - {path for path, _, _ in found}
+        connection.executemany(
+            "DELETE FROM files WHERE path = ?", [(path,) for path in removed]
+        )
+    connection.close()
+
+    return {
+        "files": len(found),
+        "parsed": len(changed),
+        "failed": n_failed,
+        "removed": len(removed),
+    }
+
+
+def load_header(db_path, path):
+    """
+    Returns the cached header of a file, if the file did not change since it
+    was cataloged.
+
+    The patient and recording identification are not cataloged and are None
+    in the returned header.
+
+    Args:
+        db_path (str): Path to the SQLite catalog.
+        path (str): Path to the EDF file.
+
+    Returns:
+        Header: The cached header, or None if the file is not (or no longer)
+            up to date in the catalog.
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+
+    connection = connect_catalog(db_path)
+    row = connection.execute(
+        f"SELECT size, mtime_ns, error, {', '.join(FILE_FIELDS)} "
+        "FROM files WHERE path = ?",
+        (path,),
+    ).fetchone()
+    if row is None or row[:3] != (stat.st_size, stat.st_mtime_ns, None):
+        connection.close()
+        return None
+
+    fields = dict(zip(FILE_FIELDS, row[3:], strict=True))
+    signals = connection.execute(
+        f"SELECT {', '.join(SIGNAL_FIELDS)} FROM signals WHERE path = ? "
+        "ORDER BY signal_index",
+        (path,),
+    ).fetchall()
+    connection.close()
+
+    return ensemble_edf.Header(
+        **fields,
+        local_patient_identification=None,
+        local_recording_identification=None,
+        reserved=None,
+        signals=tuple(
+            ensemble_edf.SignalHeader(*signal, reserved=None) for signal in signals
+        ),
+    )
+
+
+def query_catalog(db_path, sql, parameters=()):
+    """
+    Runs an SQL query against the catalog.
+
+    Args:
+        db_path (str): Path to the SQLite catalog.
+        sql (str): The query, against the files and signals tables.
+        parameters (tuple, optional): Parameters of the query.
+
+    Returns:
+        list: The rows of the result.
+    """
+    connection = connect_catalog(db_path)
+    rows = connection.execute(sql, parameters).fetchall()
+    connection.close()
+    return rows
+
+
+def find_aeeg_files(db_path, max_signals=4):
+    """
+    Returns the files that are aEEG recordings, following the same rule as
+    ensemble_edf.get_acquisition_type.
+
+    Args:
+        db_path (str): Path to the SQLite catalog.
+        max_signals (int, optional): Maximum number of signals of an aEEG
+            recording. Defaults to 4.
+
+    Returns:
+        list: The paths of the aEEG files.
+    """
+    rows = query_catalog(
+        db_path,
+        "SELECT path FROM files WHERE number_of_signals <= ? ORDER BY path",
+        (max_signals,),
+    )
+    return [path for (path,) in rows]
+
+
+def sample_rate_per_label(db_path):
+    """
+    Returns the sample rates found for every signal label.
+
+    Args:
+        db_path (str): Path to the SQLite catalog.
+
+    Returns:
+        list: (label, sample rate, number of files) tuples.
+    """
+    return query_catalog(
+        db_path,
+        "SELECT label, sample_rate, COUNT(DISTINCT path) FROM signals "
+        "GROUP BY label, sample_rate ORDER BY label, sample_rate",
+    )
+
+
+def total_recorded_hours(db_path):
+    """
+    Returns the total duration of all cataloged recordings in hours.
+
+    Args:
+        db_path (str): Path to the SQLite catalog.
+
+    Returns:
+        float: The total number of recorded hours.
+    """
+    ((seconds,),) = query_catalog(
+        db_path,
+        "SELECT SUM(number_of_data_records * duration_of_a_data_record) FROM files "
+        "WHERE number_of_data_records > 0",
+    )
+    return (seconds or 0) / 3600
@@ -1,37 +1,49 @@
+import contextlib
 import os
 import shutil
+import time
 import warnings
 from collections import namedtuple
 from datetime import datetime, timedelta
 from itertools import starmap
 
-import dateparser
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 
 
-def _str(f, size, _):
-    s = f.read(size).decode("ascii", "ignore").strip()
+def _decode_str(b):
+    s = b.decode("ascii", "ignore").strip()
     while s.endswith("\x00"):
         s = s[:-1]
     return s
 
 
-def _int(f, size, name):
-    s = _str(f, size, name)
+def _parse_int(s, name):
     try:
         return int(s)
     except ValueError:
         warnings.warn(f"{name}: Could not parse integer {s}.")
 
 
-def _float(f, size, name):
-    s = _str(f, size, name)
+def _parse_float(s, name):
     try:
         return float(s)
     except ValueError:
         warnings.warn(f"{name}: Could not parse float {s}.")
 
 
+def _str(f, size, _):
+    return _decode_str(f.read(size))
+
+
+def _int(f, size, name):
+    return _parse_int(_str(f, size, name), name)
+
+
+def _float(f, size, name):
+    return _parse_float(_str(f, size, name), name)
+
+
 def _discard(f, size, _):
     f.read(size)
 
@@ -64,12 +76,37 @@ SIGNAL_HEADER = (
 )
 
 INT_SIZE = 2
+EDF_DTYPE = np.dtype("<i2")
+COPY_BUFSIZE = 16 * 1024 * 1024
+CHUNK_RECORDS = 3600
+RECORD_COUNT_POLICIES = ("header", "file", "error")
+FICLONE = 0x40049409
 HEADER_SIZE = sum(size for _, size, _ in HEADER)
 SIGNAL_HEADER_SIZE = sum(size for _, size, _ in SIGNAL_HEADER)
 
 Header = namedtuple("Header", [name for name, _, _ in HEADER] + ["signals"])
 SignalHeader = namedtuple("SignalHeader", [name for name, _, _ in SIGNAL_HEADER])
 
+
+def _offset_table(fields):
+    """
+    Returns (name, offset, size, func) for every field of a header block.
+    Offsets of the signal header have to be multiplied by the number of
+    signals, as each field is stored for all signals before the next field.
+    """
+    table = []
+    offset = 0
+    for name, size, func in fields:
+        table.append((name, offset, size, func))
+        offset += size
+    return tuple(table)
+
+
+HEADER_TABLE = _offset_table(HEADER)
+SIGNAL_HEADER_TABLE = _offset_table(SIGNAL_HEADER)
+_NUMERIC_DTYPES = {_int: np.int64, _float: np.float64}
+_PARSERS = {_int: _parse_int, _float: _parse_float}
+
 MONTH_DICT = {
     1: "JAN",
     2: "FEB",
@@ -84,94 +121,914 @@ MONTH_DICT = {
     11: "NOV",
     12: "DEC",
 }
+MONTH_NUMBERS = {month: number for number, month in MONTH_DICT.items()}
+
+
+def _is_digits(value, n_digits):
+    """Whether value consists of exactly n_digits ASCII digits."""
+    return len(value) == n_digits and value.isascii() and value.isdigit()
+
+
+def parse_edf_date(date, date_format):
+    """
+    Parses the fixed date formats of EDF headers without dateparser.
+
+    Args:
+        date (str): The date, as dd-MMM-yyyy (e.g. 02-AUG-1951, EDF+ patient
+            and recording identification) or dd.mm.yy (startdate of
+            recording, years 85-99 in the 1900s and 00-84 in the 2000s).
+        date_format (str): Either "%d-%b-%Y" or "%d.%m.%y".
+
+    Returns:
+        datetime: The date, or None if it does not strictly follow
+            date_format.
+    """
+    separator = "-" if date_format == "%d-%b-%Y" else "."
+    parts = date.strip().split(separator)
+    if len(parts) != 3 or not all(parts):
+        return None
+
+    day, month, year = parts
+    if separator == "-":
+        month = MONTH_NUMBERS.get(month.upper())
+        if month is None or not _is_digits(year, 4):
+            return None
+    else:
+        if not (_is_digits(month, 2) and _is_digits(year, 2)):
+            return None
+        year = 1900 + int(year) if int(year) >= 85 else 2000 + int(year)
+    if not _is_digits(day, 2):
+        return None
+
+    try:
+        return datetime(int(year), int(month), int(day))
+    except ValueError:
+        return None
+
+
+def _parse_date(date, date_format):
+    """Parses a header date, falling back to dateparser for other formats."""
+    parsed = parse_edf_date(date, date_format)
+    if parsed is None:
+        import dateparser
+
+        parsed = dateparser.parse(date, date_formats=[date_format])
+    return parsed
+
+
+def decode_header_column(raw, offset, size, count, func, name):
+    """
+    Decodes one field of count consecutive fixed-width header entries.
+
+    Numeric fields are parsed in bulk, and only parsed value by value, with a
+    warning for every value that cannot be parsed, if the bulk parse fails.
+
+    Parameters:
+        raw (bytes): The raw header block.
+        offset (int): The offset of the first entry in raw.
+        size (int): The size of a single entry in bytes.
+        count (int): The number of entries.
+        func (callable): The field reader from HEADER or SIGNAL_HEADER.
+        name (str): The name of the field, used in warnings.
+
+    Returns:
+        list: The decoded values.
+    """
+    if func is _discard:
+        return [None] * count
+
+    if func in _NUMERIC_DTYPES:
+        column = np.frombuffer(raw, dtype=f"S{size}", count=count, offset=offset)
+        try:
+            return column.astype(_NUMERIC_DTYPES[func]).tolist()
+        except ValueError:
+            pass
+
+    values = [
+        _decode_str(raw[start : start + size])
+        for start in range(offset, offset + count * size, size)
+    ]
+    if func in _PARSERS:
+        values = [_PARSERS[func](value, name) for value in values]
+    return values
+
+
+def decode_edf_header(raw, raw_signals):
+    """
+    Decodes the fixed header block and the signal header block of an EDF file.
+
+    Parameters:
+        raw (bytes): The first HEADER_SIZE bytes of the file.
+        raw_signals (bytes): The number_of_signals * SIGNAL_HEADER_SIZE bytes
+            following the fixed header block.
+
+    Returns:
+        Header: The header of the EDF file, including information about the signals.
+    """
+    header = [
+        decode_header_column(raw, offset, size, 1, func, name)[0]
+        for name, offset, size, func in HEADER_TABLE
+    ]
+    number_of_signals = header[-1]
+
+    columns = [
+        decode_header_column(
+            raw_signals, offset * number_of_signals, size, number_of_signals, func, name
+        )
+        for name, offset, size, func in SIGNAL_HEADER_TABLE
+    ]
+    header.append(tuple(starmap(SignalHeader, zip(*columns, strict=True))))
+
+    return Header(*header)
+
+
+def read_raw_edf_header(fd):
+    """
+    Reads the header blocks of an EDF file without decoding them.
+
+    Reading never modifies the file. If an in-place header rewrite of a file
+    given by its path left a journal, the header may be torn and a warning
+    is given, see replay_header_journal.
+
+    Parameters:
+        fd (str or file-like object): The file descriptor or the path to the EDF file.
+
+    Returns:
+        tuple: The fixed header block and the signal header block.
+
+    Raises:
+        FileNotFoundError: If the file specified by `fd` does not exist.
+        ValueError: If `fd` is not a valid EDF file.
+    """
+    opened = False
+    if isinstance(fd, str):
+        if os.path.exists(fd + HEADER_JOURNAL_SUFFIX):
+            warnings.warn(
+                f"{fd}: the header is being rewritten, or a rewrite was "
+                "interrupted, run fix_edf_header to complete it"
+            )
+        opened = True
+        fd = open(fd, "rb")
+
+    try:
+        raw = fd.read(HEADER_SIZE)
+        if len(raw) != HEADER_SIZE:
+            raise ValueError(f"Header too short: {len(raw)} < {HEADER_SIZE} bytes.")
+
+        name, offset, size, func = HEADER_TABLE[-1]
+        number_of_signals = decode_header_column(raw, offset, size, 1, func, name)[0]
+        if number_of_signals is None:
+            raise ValueError("Could not parse the number of signals.")
+
+        raw_signals = fd.read(number_of_signals * SIGNAL_HEADER_SIZE)
+        if len(raw_signals) != number_of_signals * SIGNAL_HEADER_SIZE:
+            raise ValueError(
+                f"Signal header too short: {len(raw_signals)} < "
+                f"{number_of_signals * SIGNAL_HEADER_SIZE} bytes."
+            )
+    finally:
+        if opened:
+            fd.close()
+
+    return raw, raw_signals
+
+
+def read_edf_reserved(fd):
+    """
+    Reads the reserved field of an EDF header, which read_edf_header discards.
+
+    Parameters:
+        fd (str or file-like object): The file descriptor or the path to the EDF file.
+
+    Returns:
+        bytes: The raw field, holding "EDF+C" or "EDF+D" for an EDF+ file.
+    """
+    raw = read_raw_edf_header(fd)[0]
+    _, offset, size, _ = next(field for field in HEADER_TABLE if field[0] == "reserved")
+    return raw[offset : offset + size]
+
+
+def read_edf_header(fd, record_count="header"):
+    """
+    Reads the header of an EDF file.
+
+    Parameters:
+        fd (str or file-like object): The file descriptor or the path to the EDF file.
+        record_count (str, optional): How to determine the number of data
+            records, see resolve_record_count. Defaults to "header".
+
+    Returns:
+        Header: The header of the EDF file, including information about the signals.
+
+    Raises:
+        FileNotFoundError: If the file specified by `fd` does not exist.
+        ValueError: If `fd` is not a valid EDF file, or if its number of data
+            records does not match its size and record_count is "error".
+    """
+    if record_count not in RECORD_COUNT_POLICIES:
+        raise ValueError(
+            f"record_count must be one of {RECORD_COUNT_POLICIES}, not {record_count}"
+        )
+
+    header = decode_edf_header(*read_raw_edf_header(fd))
+    return resolve_record_count(fd, header, record_count)
+
+
+def data_record_length(header):
+    """
+    Returns the number of samples in one data record of an EDF file.
+
+    Parameters:
+        header (Header): The EDF header object containing information about the data.
+
+    Returns:
+        int: The sum of the number of samples of every signal in a data record.
+    """
+    return sum(signal.nr_of_samples_in_each_data_record for signal in header.signals)
+
+
+def count_data_records(fd, header):
+    """
+    Derives the number of data records from the size of an EDF file.
+
+    Only the size of the file is looked up, so this takes the same time for
+    every file. The byte counts are Python integers, so files larger than
+    4 GB are counted correctly on every platform.
+
+    Parameters:
+        fd (str or file-like object): The file descriptor or the path to the EDF file.
+        header (Header): The EDF header object containing information about the data.
+
+    Returns:
+        tuple: The number of complete data records in the file and the number
+            of bytes of an incomplete last data record.
+    """
+    if isinstance(fd, str):
+        size = os.path.getsize(fd)
+    else:
+        position = fd.tell()
+        size = fd.seek(0, os.SEEK_END)
+        fd.seek(position)
+
+    data_size = max(
+        size - HEADER_SIZE - header.number_of_signals * SIGNAL_HEADER_SIZE, 0
+    )
+    record_size = data_record_length(header) * INT_SIZE
+    if record_size == 0:
+        return 0, data_size
+    return divmod(data_size, record_size)
+
+
+def resolve_record_count(fd, header, policy="header"):
+    """
+    Determines the number of data records of an EDF file.
+
+    The number of data records in the header is -1 for recordings that were
+    not closed properly, and is too large for truncated files. The policy
+    decides what to trust:
+
+    - "header": the header, unless it is -1 or more than the file holds,
+      then the number of complete data records in the file.
+    - "file": the number of complete data records that fit in the file.
+    - "error": raise if the header does not match the file size.
+
+    Parameters:
+        fd (str or file-like object): The file descriptor or the path to the EDF file.
+        header (Header): The EDF header object containing information about the data.
+        policy (str, optional): "header", "file" or "error". Defaults to
+            "header".
+
+    Returns:
+        Header: The header with the resolved number_of_data_records.
+
+    Raises:
+        ValueError: If policy is "error" and the header does not match the
+            file size.
+    """
+    n_records, remainder = count_data_records(fd, header)
+    if n_records == header.number_of_data_records and not remainder:
+        return header
+
+    message = (
+        f"The header has {header.number_of_data_records} data records, "
+        f"the file holds {n_records}"
+        + (f" and {remainder} bytes of an incomplete data record" if remainder else "")
+    )
+    if policy == "error":
+        raise ValueError(message)
+    if policy == "file" or not 0 <= header.number_of_data_records <= n_records:
+        warnings.warn(f"{message}, using {n_records}.")
+        return header._replace(number_of_data_records=n_records)
+    return header
+
+
+def signal_offsets(header):
+    """
+    Returns the sample offsets of every signal within one data record.
 
+    Parameters:
+        header (Header): The EDF header object containing information about the data.
+
+    Returns:
+        np.ndarray: Array of length number_of_signals + 1, signal i occupies the
+            samples offsets[i]:offsets[i + 1] of each data record.
+    """
+    samples = [signal.nr_of_samples_in_each_data_record for signal in header.signals]
+    return np.concatenate(([0], np.cumsum(samples, dtype=np.int64)))
+
+
+def memmap_edf_data(fd, header, mode="r", start=0, end=None):
+    """
+    Memory-maps the data section of an EDF file.
+
+    The data section is mapped once and exposed as a two dimensional int16
+    array with one row per data record, so no data is read until it is
+    accessed.
+
+    Parameters:
+        fd (str or file-like object): The file path or file-like object to map.
+        header (Header): The EDF header object containing information about the data.
+        mode (str, optional): The mode used to open the memory map. Defaults to "r".
+        start (int, optional): The first data record to map. Defaults to 0.
+        end (int, optional): The data record to stop mapping at. Defaults to
+            None, which maps up to the last data record. Data records beyond
+            the end of the file are never mapped.
+
+    Returns:
+        np.ndarray: Array of shape (end - start, data_record_length).
+    """
+    record_length = data_record_length(header)
+    if end is None:
+        end = header.number_of_data_records
+    end = min(end, count_data_records(fd, header)[0])
+    shape = (max(end - start, 0), record_length)
+
+    if shape[0] == 0 or record_length == 0:
+        return np.zeros(shape, dtype=EDF_DTYPE)
+
+    return np.memmap(
+        fd,
+        dtype=EDF_DTYPE,
+        mode=mode,
+        offset=HEADER_SIZE
+        + header.number_of_signals * SIGNAL_HEADER_SIZE
+        + start * record_length * INT_SIZE,
+        shape=shape,
+    )
+
+
+def get_channel_indices(header, chans="all"):
+    """
+    Resolves a channel selection to signal indices.
+
+    Parameters:
+        header (Header): The EDF header object containing information about the data.
+        chans (str or list, optional): "all", or a list of signal indices
+            and/or signal labels. Defaults to "all".
+
+    Returns:
+        list: The selected signal indices, in file order.
+
+    Raises:
+        ValueError: If a label is not found in the header.
+    """
+    if chans == "all":
+        return list(range(header.number_of_signals))
+
+    labels = [signal.label for signal in header.signals]
+    indices = set()
+    for chan in chans:
+        if isinstance(chan, str):
+            if chan not in labels:
+                raise ValueError(f"Channel {chan} not found in {labels}")
+            chan = labels.index(chan)
+        indices.add(chan)
+
+    return sorted(indices)
+
+
+def get_data_channel_indices(header):
+    """
+    Returns the indices of every signal except EDF Annotations.
+
+    Parameters:
+        header (Header): The EDF header object containing information about the data.
+
+    Returns:
+        list: The indices of the data signals, in file order.
+    """
+    return [
+        i
+        for i, signal in enumerate(header.signals)
+        if signal.label != "EDF Annotations"
+    ]
+
+
+def get_record_range(header, start_time=0, duration=None):
+    """
+    Returns the data records that cover a time window.
+
+    Parameters:
+        header (Header): The EDF header object containing information about the data.
+        start_time (float, optional): The start of the window in seconds from
+            the start of the recording. Defaults to 0.
+        duration (float, optional): The length of the window in seconds.
+            Defaults to None, which runs to the end of the recording.
+
+    Returns:
+        tuple: The first data record and the data record to stop at.
+    """
+    record_duration = header.duration_of_a_data_record
+    n_records = header.number_of_data_records
+
+    start = int(np.floor(start_time / record_duration + 1e-9))
+    if duration is None:
+        end = n_records
+    else:
+        end = int(np.ceil((start_time + duration) / record_duration - 1e-9))
+
+    return min(max(start, 0), n_records), min(max(end, 0), n_records)
+
+
+def get_signal_views(data, header, chans="all"):
+    """
+    Splits memory-mapped data records into one view per signal.
+
+    Parameters:
+        data (np.ndarray): The data records as returned by memmap_edf_data.
+        header (Header): The EDF header object containing information about the data.
+        chans (str or list, optional): The indices and/or labels of the
+            signals to return. Defaults to "all".
+
+    Returns:
+        list: One strided view of shape (number_of_data_records,
+            nr_of_samples_in_each_data_record) per selected signal, in file order.
+            No data is copied.
+    """
+    offsets = signal_offsets(header)
+    return [
+        data[:, offsets[chan_nr] : offsets[chan_nr + 1]]
+        for chan_nr in get_channel_indices(header, chans)
+    ]
+
+
+def interleave_signals(signals, samples_per_record, n_records=None):
+    """
+    Interleaves the samples of several signals into EDF data records.
+
+    Parameters:
+        signals (list): One array per signal, either one dimensional or of
+            shape (records, samples per record).
+        samples_per_record (list): The number of samples in each data record
+            for every signal.
+        n_records (int, optional): The number of data records to interleave.
+            Defaults to None, which uses the number of whole data records
+            available in every signal.
+
+    Returns:
+        np.ndarray: Array of shape (n_records, sum(samples_per_record)), laid
+            out as the data section of an EDF file.
+    """
+    if n_records is None:
+        n_records = min(
+            len(signal) if signal.ndim == 2 else len(signal) // spr
+            for signal, spr in zip(signals, samples_per_record, strict=True)
+        )
+
+    records = [
+        signal[:n_records] if signal.ndim == 2 else signal[: n_records * spr]
+        for signal, spr in zip(signals, samples_per_record, strict=True)
+    ]
+    records = [
+        np.reshape(record, (n_records, spr))
+        for record, spr in zip(records, samples_per_record, strict=True)
+    ]
+
+    if len(set(samples_per_record)) == 1:
+        return np.stack(records, axis=1).reshape(n_records, -1)
+
+    data = np.empty(
+        (n_records, sum(samples_per_record)), dtype=np.result_type(*records)
+    )
+    offset = 0
+    for record, spr in zip(records, samples_per_record, strict=True):
+        data[:, offset : offset + spr] = record
+        offset += spr
+
+    return data
+
+
+def read_edf_data(fd, header, chans="all", start=0, end=None):
+    """
+    Reads EDF data from a file or file-like object.
+
+    Parameters:
+        fd (str or file-like object): The file path or file-like object to read the EDF data from.
+        header (Header): The EDF header object containing information about the data.
+        chans (str or list, optional): The indices and/or labels of the
+            signals to read. Defaults to "all".
+        start (int, optional): The first data record to read. Defaults to 0.
+        end (int, optional): The data record to stop reading at. Defaults to
+            None, which reads up to the last data record.
+
+    Returns:
+        generator: A generator that yields each data record as a list of signals.
+
+    Raises:
+        IOError: If there was an error opening or reading the EDF file.
+    """
+    data = memmap_edf_data(fd, header, start=start, end=end)
+    views = get_signal_views(data, header, chans)
+
+    for i in range(len(data)):
+        yield [view[i] for view in views]
+
+
+def read_edf_window(fd, header, start_time=0, duration=None, chans="all"):
+    """
+    Reads a time window of selected signals from an EDF file.
+
+    Only the data records covering the window are mapped, so the time it
+    takes does not depend on where the window lies in the recording.
+
+    Parameters:
+        fd (str or file-like object): The file path or file-like object to read the EDF data from.
+        header (Header): The EDF header object containing information about the data.
+        start_time (float, optional): The start of the window in seconds from
+            the start of the recording. Defaults to 0.
+        duration (float, optional): The length of the window in seconds.
+            Defaults to None, which reads to the end of the recording.
+        chans (str or list, optional): The indices and/or labels of the
+            signals to read. Defaults to "all".
+
+    Returns:
+        list: One array with the samples in the window per selected signal,
+            in file order.
+    """
+    start, end = get_record_range(header, start_time, duration)
+    data = memmap_edf_data(fd, header, start=start, end=end)
+    chans = get_channel_indices(header, chans)
+
+    window = []
+    offset_time = max(start_time, 0) - start * header.duration_of_a_data_record
+    for chan, view in zip(chans, get_signal_views(data, header, chans), strict=True):
+        fs = (
+            header.signals[chan].nr_of_samples_in_each_data_record
+            / header.duration_of_a_data_record
+        )
+        first = round(offset_time * fs)
+        samples = view.reshape(-1)
+        if duration is None:
+            window.append(np.array(samples[first:]))
+        else:
+            window.append(np.array(samples[first : first + round(duration * fs)]))
+
+    return window
+
+
+def get_gain_offset(header, chans="all"):
+    """
+    Computes the calibration of the selected signals from the header.
+
+    Physical values are obtained from digital values as
+    gain * digital + offset.
+
+    Parameters:
+        header (Header): The EDF header object containing information about the data.
+        chans (str or list, optional): The indices and/or labels of the
+            signals. Defaults to "all".
+
+    Returns:
+        tuple: Two float64 arrays with the gain and the offset of every
+            selected signal, in file order.
+
+    Raises:
+        ValueError: If the digital maximum of a signal equals its digital minimum.
+    """
+    signals = [header.signals[chan] for chan in get_channel_indices(header, chans)]
+    physical_minimum = np.array([s.physical_minimum for s in signals], dtype=float)
+    physical_maximum = np.array([s.physical_maximum for s in signals], dtype=float)
+    digital_minimum = np.array([s.digital_minimum for s in signals], dtype=float)
+    digital_maximum = np.array([s.digital_maximum for s in signals], dtype=float)
+
+    if np.any(digital_maximum == digital_minimum):
+        raise ValueError("Digital maximum equals digital minimum, cannot calibrate.")
+
+    gain = (physical_maximum - physical_minimum) / (digital_maximum - digital_minimum)
+    offset = physical_maximum - gain * digital_maximum
+
+    return gain, offset
+
+
+def _calibrate(digital, gain, offset, out):
+    np.multiply(digital, gain, out=out)
+    out += offset
+    return out
+
+
+def iter_edf_physical(
+    fd,
+    header,
+    chans="all",
+    start=0,
+    end=None,
+    chunk_records=CHUNK_RECORDS,
+    out=None,
+    dtype=np.float64,
+):
+    """
+    Reads EDF data in physical units, chunk by chunk.
+
+    The calibration is computed once from the header and applied to a whole
+    chunk of data records per signal, writing into the same output buffers
+    for every chunk.
+
+    Parameters:
+        fd (str or file-like object): The file path or file-like object to read the EDF data from.
+        header (Header): The EDF header object containing information about the data.
+        chans (str or list, optional): The indices and/or labels of the
+            signals to read. Defaults to "all".
+        start (int, optional): The first data record to read. Defaults to 0.
+        end (int, optional): The data record to stop reading at. Defaults to
+            None, which reads up to the last data record.
+        chunk_records (int, optional): The number of data records per chunk.
+            Defaults to CHUNK_RECORDS.
+        out (list, optional): One float32 or float64 buffer of shape
+            (chunk_records, nr_of_samples_in_each_data_record) per selected
+            signal. Defaults to None, which allocates them once.
+        dtype (np.dtype, optional): The data type of the allocated buffers.
+            Defaults to np.float64.
+
+    Yields:
+        list: For every chunk, one view of the output buffers per selected
+            signal with the physical values of the data records in the chunk.
+            The buffers are overwritten by the next chunk.
+    """
+    chans = get_channel_indices(header, chans)
+    gain, offset = get_gain_offset(header, chans)
+    data = memmap_edf_data(fd, header, start=start, end=end)
+    views = get_signal_views(data, header, chans)
+
+    if out is None:
+        out = [np.empty((chunk_records, view.shape[1]), dtype=dtype) for view in views]
+
+    for chunk_start in range(0, len(data), chunk_records):
+        chunk_end = min(chunk_start + chunk_records, len(data))
+        n = chunk_end - chunk_start
+        chunk = []
+        for view, buffer, g, o in zip(views, out, gain, offset, strict=True):
+            chunk.append(_calibrate(view[chunk_start:chunk_end], g, o, buffer[:n]))
+        yield chunk
+
+
+def read_edf_physical(fd, header, chans="all", start=0, end=None, out=None):
+    """
+    Reads EDF data in physical units.
+
+    Parameters:
+        fd (str or file-like object): The file path or file-like object to read the EDF data from.
+        header (Header): The EDF header object containing information about the data.
+        chans (str or list, optional): The indices and/or labels of the
+            signals to read. Defaults to "all".
+        start (int, optional): The first data record to read. Defaults to 0.
+        end (int, optional): The data record to stop reading at. Defaults to
+            None, which reads up to the last data record.
+        out (list, optional): One float32 or float64 array per selected
+            signal, holding exactly its samples in the requested records.
+            Defaults to None, which allocates float64 arrays.
+
+    Returns:
+        list: One array of shape (records, nr_of_samples_in_each_data_record)
+            per selected signal, in file order.
+    """
+    chans = get_channel_indices(header, chans)
+    gain, offset = get_gain_offset(header, chans)
+    data = memmap_edf_data(fd, header, start=start, end=end)
+    views = get_signal_views(data, header, chans)
+
+    if out is None:
+        out = [np.empty(view.shape) for view in views]
+    out = [
+        np.reshape(buffer, view.shape) for buffer, view in zip(out, views, strict=True)
+    ]
+
+    for view, buffer, g, o in zip(views, out, gain, offset, strict=True):
+        _calibrate(view, g, o, buffer)
+
+    return out
+
+
+def iter_edf_epochs(
+    fd,
+    header,
+    duration,
+    hop=None,
+    chans=None,
+    batch_size=None,
+    physical=False,
+    dtype=np.float64,
+    chunk_records=CHUNK_RECORDS,
+):
+    """
+    Reads an EDF file as fixed-length, possibly overlapping epochs.
+
+    The selected signals are read chunk_records data records at a time into
+    one (channels, samples) buffer per chunk. Every epoch is a strided view
+    of that buffer, so no samples are copied per epoch. Only the samples of
+    the epochs that continue in the next chunk are carried over to it.
+
+    Parameters:
+        fd (str or file-like object): The file path or file-like object to read the EDF data from.
+        header (Header): The EDF header object containing information about the data.
+        duration (float): The length of an epoch in seconds.
+        hop (float, optional): The time between the starts of consecutive
+            epochs in seconds. Defaults to None, which uses duration (no
+            overlap). Use duration / 2 for 50% overlap.
+        chans (str or list, optional): The indices and/or labels of the
+            signals to read, all with the same sample rate. Defaults to None,
+            which reads every signal except EDF Annotations.
+        batch_size (int, optional): Yield batches of this many epochs.
+            Defaults to None, which yields the epochs one by one.
+        physical (bool, optional): Yield physical instead of digital values.
+            Defaults to False.
+        dtype (np.dtype, optional): The data type of physical values.
+            Defaults to np.float64.
+        chunk_records (int, optional): The number of data records read at
+            once. Defaults to CHUNK_RECORDS.
 
-def read_edf_header(fd):
+    Raises:
+        ValueError: If the selected signals have different sample rates, or
+            if the epoch or hop is shorter than one sample.
+
+    Yields:
+        tuple: The onset of the epoch in seconds and a read-only view of shape
+            (channels, samples), or in batched mode an array of onsets and a
+            view of shape (epochs, channels, samples). The last batch may hold
+            fewer epochs. Copy an epoch to modify it.
     """
-    Reads the header of an EDF file.
+    if chans is None:
+        chans = get_data_channel_indices(header)
+    chans = get_channel_indices(header, chans)
+    samples_per_record = {
+        header.signals[chan].nr_of_samples_in_each_data_record for chan in chans
+    }
+    if len(samples_per_record) != 1:
+        raise ValueError("Epochs need signals with the same sample rate")
+    samples_per_record = samples_per_record.pop()
+    fs = samples_per_record / header.duration_of_a_data_record
+
+    window = round(duration * fs)
+    step = round((duration if hop is None else hop) * fs)
+    if window < 1 or step < 1:
+        raise ValueError(f"Epoch of {duration} s or hop of {hop} s is too short")
+    batch = batch_size or 1
+
+    data = memmap_edf_data(fd, header)
+    views = get_signal_views(data, header, chans)
+    if physical:
+        gain, offset = get_gain_offset(header, chans)
+    else:
+        dtype = EDF_DTYPE
+
+    carry = np.empty((len(chans), 0), dtype=dtype)
+    position = 0  # sample index of carry[:, 0]
+    skip = 0  # samples between the carry and the next epoch if hop > duration
+
+    for chunk_start in range(0, len(data), chunk_records):
+        chunk_end = min(chunk_start + chunk_records, len(data))
+        n_new = (chunk_end - chunk_start) * samples_per_record
+        if skip >= n_new:
+            skip -= n_new
+            position += n_new
+            continue
 
-    Parameters:
-        fd (str or file-like object): The file descriptor or the path to the EDF file.
+        n_carry = carry.shape[1]
+        buffer = np.empty((len(chans), n_carry + n_new - skip), dtype=dtype)
+        buffer[:, :n_carry] = carry
+        for i, view in enumerate(views):
+            samples = view[chunk_start:chunk_end].reshape(-1)[skip:]
+            if physical:
+                _calibrate(samples, gain[i], offset[i], buffer[i, n_carry:])
+            else:
+                buffer[i, n_carry:] = samples
+        position += skip
+        skip = 0
+
+        n_epochs = max((buffer.shape[1] - window) // step + 1, 0)
+        if chunk_end < len(data):
+            # keep batches full, the remaining epochs start the next chunk
+            n_epochs -= n_epochs % batch
+
+        if n_epochs:
+            epochs = sliding_window_view(buffer, window, axis=1)
+            epochs = epochs[:, : n_epochs * step : step].transpose(1, 0, 2)
+            onsets = (position + step * np.arange(n_epochs)) / fs
+            if batch_size is None:
+                yield from zip(onsets.tolist(), epochs, strict=True)
+            else:
+                for k in range(0, n_epochs, batch):
+                    yield onsets[k : k + batch], epochs[k : k + batch]
+
+        consumed = min(n_epochs * step, buffer.shape[1])
+        skip = n_epochs * step - consumed
+        carry = buffer[:, consumed:].copy()
+        position += consumed
+
+
+def encode_header_field(name, val, size):
+    """
+    Encodes a single field of the fixed part of an EDF header.
 
-    Returns:
-        Header: The header of the EDF file, including information about the signals.
+    Args:
+        name (str): The name of the field, as listed in HEADER.
+        val: The value to encode.
+        size (int): The number of bytes reserved for the field.
 
     Raises:
-        FileNotFoundError: If the file specified by `fd` does not exist.
-        ValueError: If `fd` is not a valid EDF file.
+        AssertionError: If the encoded value is longer than the expected size.
+
+    Returns:
+        bytes: The encoded field, padded with spaces to size.
     """
-    opened = False
-    if isinstance(fd, str):
-        opened = True
-        fd = open(fd, "rb")
+    if val is None:
+        val = b" " * size
 
-    header = [func(fd, size, name) for name, size, func in HEADER]
-    number_of_signals = header[-1]
-    signal_headers = [[] for _ in range(number_of_signals)]
+    if not isinstance(val, bytes):
+        if (
+            name in {"startdate_of_recording", "starttime_of_recording"}
+        ) and not isinstance(val, str):
+            h = val[0]
+            m = val[1]
+            s = val[2] % 100
+            val = f"{h:02d}.{m:02d}.{s:02d}"
+        val = bytes(str(val), encoding="ascii").ljust(size, b" ")
 
-    for name, size, func in SIGNAL_HEADER:
-        for signal_header in signal_headers:
-            signal_header.append(func(fd, size, name))
+    assert len(val) == size, f"{val} too long! Need to be shorter than {size} bytes."
+    return val
 
-    header.append(tuple(starmap(SignalHeader, signal_headers)))
 
-    if opened:
-        fd.close()
+def encode_signal_header_field(val, size):
+    """
+    Encodes a single field of a signal header. Numbers that do not fit in
+    size bytes are converted to scientific notation.
 
-    return Header(*header)
+    Args:
+        val: The value to encode.
+        size (int): The number of bytes reserved for the field.
 
+    Raises:
+        AssertionError: If the encoded value is longer than the expected size.
 
-def read_edf_data(fd, header, chans="all"):
+    Returns:
+        bytes: The encoded field, padded with spaces to size.
     """
-    Reads EDF data from a file or file-like object.
+    if val is None:
+        val = b" " * size
 
-    Parameters:
-        fd (str or file-like object): The file path or file-like object to read the EDF data from.
-        header (Header): The EDF header object containing information about the data.
+    if not isinstance(val, bytes):
+        val = bytes(str(val), encoding="ascii").ljust(size, b" ")
 
-    Returns:
-        generator: A generator that yields each data record as a list of signals.
+    if len(val) > size:
+        try:
+            val = float(val)
+        except ValueError as e:
+            raise AssertionError(
+                f"{val} too long! Need to be shorter than {size} bytes."
+            ) from e
+        # convert float to scientific expression
+        precision = 2 if val >= 0 else 1
+        val = bytes(f"{val:.{precision}e}", encoding="ascii").ljust(size, b" ")
 
-    Raises:
-        IOError: If there was an error opening or reading the EDF file.
-    """
-    opened = False
-    if isinstance(fd, str):
-        fd = open(fd, "rb")
-        opened = True
+    assert len(val) == size, f"{val} too long! Need to be shorter than {size} bytes."
+    return val
 
-        start = 0
-        end = header.number_of_data_records
 
-        if chans == "all":
-            chans = list(range(header.number_of_signals))
+def encode_edf_header(header):
+    """
+    Encodes a complete EDF header, including the signal headers.
 
-        data_record_length = sum(
-            signal.nr_of_samples_in_each_data_record for signal in header.signals
-        )
+    Args:
+        header (Header): The header information to encode.
 
-        if opened:
-            fd.seek(
-                HEADER_SIZE
-                + header.number_of_signals * SIGNAL_HEADER_SIZE
-                + start * data_record_length * INT_SIZE
-            )
+    Raises:
+        AssertionError: If the length of a value is larger than the expected size.
 
-        for _ in range(start, end):
-            a = np.fromfile(fd, count=data_record_length, dtype=np.int16)
+    Returns:
+        bytes: The encoded header.
+    """
+    number_of_signals = len(header.signals)
+    encoded = bytearray(HEADER_SIZE + number_of_signals * SIGNAL_HEADER_SIZE)
 
-            offset = 0
-            data_record = []
-            for chan_nr, signal in enumerate(header.signals):
-                new_offset = offset + signal.nr_of_samples_in_each_data_record
-                if chan_nr in chans:
-                    data_record.append(a[offset:new_offset])
-                offset = new_offset
+    for val, (name, offset, size, _) in zip(header, HEADER_TABLE, strict=False):
+        encoded[offset : offset + size] = encode_header_field(name, val, size)
 
-            yield data_record
+    for vals, (_, offset, size, _) in zip(zip(*header.signals), SIGNAL_HEADER_TABLE):  # noqa: B905
+        start = HEADER_SIZE + offset * number_of_signals
+        encoded[start : start + size * number_of_signals] = b"".join(
+            encode_signal_header_field(val, size) for val in vals
+        )
 
-    if opened:
-        fd.close()
+    return bytes(encoded)
 
 
 def write_edf_header(fd, header):
@@ -193,56 +1050,323 @@ def write_edf_header(fd, header):
         fd = open(fd, "wb")
         opened = True
 
-        for val, (name, size, _) in zip(header, HEADER, strict=False):
-            if val is None:
-                val = b" " * size
-
-            if not isinstance(val, bytes):
-                if (
-                    name in {"startdate_of_recording", "starttime_of_recording"}
-                ) and not isinstance(val, str):
-                    h = val[0]
-                    m = val[1]
-                    s = val[2] % 100
-                    val = f"{h:02d}.{m:02d}.{s:02d}"
-                val = bytes(val, encoding="ascii").ljust(size, b" ")
-
-            assert len(val) == size
-            fd.write(val)
-
-        for vals, (_, size, _) in zip(zip(*header.signals), SIGNAL_HEADER):  # noqa: B905
-            for val in vals:
-                if val is None:
-                    val = b" " * size
-
-                if not isinstance(val, bytes):
-                    val = bytes(val, encoding="ascii").ljust(size, b" ")
-
-                if len(val) > size:
-                    try:
-                        val = float(val)
-                    except ValueError as e:
-                        raise AssertionError(
-                            f"{val} too long! Need to be shorter than {size} bytes."
-                        ) from e
-                    # convert float to scientific expression
-                    precision = 2 if val >= 0 else 1
-                    val = bytes(f"{val:.{precision}e}", encoding="ascii").ljust(
-                        size, b" "
-                    )
-
-                assert len(val) == size, (
-                    f"{val} too long! Need to be shorter than {size} bytes."
-                )
-                fd.write(val)
+    fd.write(encode_edf_header(header))
 
     if opened:
         fd.close()
 
 
+def patch_edf_header(raw, old_header, new_header):
+    """
+    Patches the fields that differ between two EDF headers into raw header bytes.
+
+    Fields that did not change keep their original bytes, including fields
+    that are not parsed, such as the reserved field holding EDF+C/EDF+D.
+
+    Args:
+        raw (bytes): The raw header as it is stored in the file.
+        old_header (Header): The header parsed from raw.
+        new_header (Header): The header to write.
+
+    Raises:
+        ValueError: If the number of signals differs between both headers.
+
+    Returns:
+        bytes: The patched header.
+    """
+    if old_header.number_of_signals != new_header.number_of_signals:
+        raise ValueError(
+            "Cannot patch the header in place if the number of signals changes: "
+            f"{old_header.number_of_signals} != {new_header.number_of_signals}"
+        )
+
+    patched = bytearray(raw)
+    for name, offset, size, _ in HEADER_TABLE:
+        val = getattr(new_header, name)
+        if name != "reserved" and val != getattr(old_header, name):
+            patched[offset : offset + size] = encode_header_field(name, val, size)
+
+    number_of_signals = new_header.number_of_signals
+    for name, offset, size, _ in SIGNAL_HEADER_TABLE:
+        for i, (old, new) in enumerate(
+            zip(old_header.signals, new_header.signals, strict=True)
+        ):
+            val = getattr(new, name)
+            if name != "reserved" and val != getattr(old, name):
+                start = HEADER_SIZE + offset * number_of_signals + i * size
+                patched[start : start + size] = encode_signal_header_field(val, size)
+
+    return bytes(patched)
+
+
+HEADER_JOURNAL_SUFFIX = ".header"
+HEADER_LOCK_SUFFIX = ".lock"
+HEADER_LOCK_TIMEOUT = 10
+
+
+def _fsync_directory(path):
+    """Makes a rename or removal in the directory of path durable."""
+    if os.name == "nt":
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@contextlib.contextmanager
+def _header_lock(fd, timeout=HEADER_LOCK_TIMEOUT):
+    """
+    Holds the header lock of fd, a lock file next to its journal, so that
+    only one process rewrites the header or replays the journal at a time.
+    """
+    lock = fd + HEADER_JOURNAL_SUFFIX + HEADER_LOCK_SUFFIX
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            if time.monotonic() > deadline:
+                raise TimeoutError(
+                    f"{lock} exists: another process is rewriting the header "
+                    f"of {fd}, or remove the lock if that process was killed"
+                ) from None
+            time.sleep(0.05)
+    try:
+        yield
+    finally:
+        os.remove(lock)
+
+
+def _replay_header_journal(fd):
+    """Replays the journal of fd, the caller holds the header lock."""
+    journal = fd + HEADER_JOURNAL_SUFFIX
+    if os.path.exists(journal + ".tmp"):
+        os.remove(journal + ".tmp")
+    if not os.path.exists(journal):
+        return False
+
+    with open(journal, "rb") as f:
+        raw = f.read()
+    with open(fd, "r+b") as f:
+        f.write(raw)
+        f.flush()
+        os.fsync(f.fileno())
+    os.remove(journal)
+    _fsync_directory(fd)
+    return True
+
+
+def replay_header_journal(fd):
+    """
+    Completes an in-place header rewrite that was interrupted.
+
+    rewrite_edf_header writes the new header block to a journal next to the
+    file before it overwrites the header. If the journal still exists, the
+    header may be torn, so the journal is written over it again and removed.
+    A journal that was never completely written is discarded, the header is
+    then still the old one. The header lock is held meanwhile, so a rewrite
+    in progress in another process is waited for instead of replayed.
+
+    Args:
+        fd (str): (Relative) path to the EDF file.
+
+    Raises:
+        TimeoutError: If the header lock is not released within
+            HEADER_LOCK_TIMEOUT seconds.
+
+    Returns:
+        bool: Whether a journal was replayed.
+    """
+    with _header_lock(fd):
+        return _replay_header_journal(fd)
+
+
+def _clone_file(src, dst):
+    """
+    Tries to reflink src into dst. Returns True on success.
+    """
+    try:
+        import fcntl
+
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    except (ImportError, OSError):
+        return False
+    return True
+
+
+def _copy_file_data(src, dst, offset, count, hasher=None):
+    """
+    Copies count bytes from offset in src to the same offset in dst, in the
+    kernel where possible. If hasher is given the data is copied in user
+    space instead and hashed while it is copied.
+    """
+    if hasher is not None:
+        src.seek(offset)
+        dst.seek(offset)
+        buffer = memoryview(bytearray(COPY_BUFSIZE))
+        while count > 0:
+            n = src.readinto(buffer[: min(count, COPY_BUFSIZE)])
+            if n == 0:
+                break
+            hasher.update(buffer[:n])
+            dst.write(buffer[:n])
+            count -= n
+        return
+
+    dst.flush()
+    end = offset + count
+    try:
+        while offset < end:
+            copied = os.copy_file_range(
+                src.fileno(), dst.fileno(), end - offset, offset, offset
+            )
+            if copied == 0:
+                break
+            offset += copied
+    except (AttributeError, OSError):
+        pass
+
+    try:
+        os.lseek(dst.fileno(), offset, os.SEEK_SET)
+        while offset < end:
+            copied = os.sendfile(dst.fileno(), src.fileno(), offset, end - offset)
+            if copied == 0:
+                break
+            offset += copied
+    except (AttributeError, OSError):
+        pass
+
+    src.seek(offset)
+    dst.seek(offset)
+    shutil.copyfileobj(src, dst, COPY_BUFSIZE)
+
+
+def rewrite_edf_header(fd, header, fd_out=None, hasher=None):
+    """
+    Writes a new header to an EDF file without rewriting its data section.
+
+    Only the header fields that differ from the header currently stored in fd
+    are changed. If fd_out is None the header block of fd is replaced in
+    place: the new block is first written to a journal file next to fd,
+    fsynced and atomically renamed, then written over the old header and
+    fsynced, after which the journal is removed. If this is interrupted, the
+    next rewrite of the header replays the journal, see
+    replay_header_journal. The header lock of fd is held throughout, so
+    rewrites in several processes do not interleave. A file with other
+    hardlinks is first replaced by a copy, so the other names keep the old
+    header.
+    Otherwise fd_out is created with the new header and the data section of
+    fd, using a reflink or a kernel-side copy whenever the platform supports
+    it.
+
+    Args:
+        fd (str): (Relative) path to the EDF file.
+        header (Header): The header to write.
+        fd_out (str, optional): (Relative) path to the file to write. Defaults
+            to None, which rewrites fd in place.
+        hasher (hashlib hash, optional): Updated with the data section while
+            it is copied to fd_out, so hashing needs no extra read pass. The
+            copy then runs in user space instead of a reflink or kernel copy.
+            Defaults to None.
+
+    Raises:
+        ValueError: If the number of signals differs from the stored header,
+            or if a hasher is given without fd_out.
+        TimeoutError: If the header lock is not released within
+            HEADER_LOCK_TIMEOUT seconds.
+
+    Returns:
+        None
+    """
+    if hasher is not None and fd_out is None:
+        raise ValueError("A hasher needs fd_out, the data is not copied in place")
+
+    with _header_lock(fd):
+        _replay_header_journal(fd)
+        _rewrite_edf_header(fd, header, fd_out, hasher)
+
+
+def _rewrite_edf_header(fd, header, fd_out, hasher):
+    """Rewrites the header of fd, the caller holds the header lock."""
+    # the stored header, whose number of data records may differ from header
+    raw, raw_signals = read_raw_edf_header(fd)
+    old_header = decode_edf_header(raw, raw_signals)
+    header_length = len(raw) + len(raw_signals)
+    raw = patch_edf_header(raw + raw_signals, old_header, header)
+
+    if fd_out is None:
+        # a hardlinked file is shared with its other names, patch a copy
+        if os.stat(fd).st_nlink > 1:
+            copy_edf_file(fd, fd + ".unlink")
+            os.replace(fd + ".unlink", fd)
+            _fsync_directory(fd)
+
+        journal = fd + HEADER_JOURNAL_SUFFIX
+        with open(journal + ".tmp", "wb") as f:
+            f.write(raw)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(journal + ".tmp", journal)
+        _fsync_directory(journal)
+
+        with open(fd, "r+b") as f:
+            f.write(raw)
+            f.flush()
+            os.fsync(f.fileno())
+        os.remove(journal)
+        _fsync_directory(journal)
+        return
+
+    size = os.path.getsize(fd)
+    with open(fd, "rb") as src, open(fd_out, "wb") as dst:
+        cloned = hasher is None and _clone_file(src, dst)
+        dst.write(raw)
+        if not cloned:
+            _copy_file_data(src, dst, header_length, size - header_length, hasher)
+
+
+def copy_edf_file(fd, fd_out, link=False):
+    """
+    Copies an EDF file, without copying its data where possible.
+
+    Args:
+        fd (str): (Relative) path to the EDF file.
+        fd_out (str): (Relative) path to the copy, which must not exist.
+        link (bool, optional): Hardlink fd_out to fd if both are on the same
+            filesystem. Defaults to False.
+
+    Returns:
+        str: How the file was copied: "hardlink", "reflink" or "copy" (a
+            kernel-side copy where the platform supports it).
+    """
+    if link:
+        try:
+            os.link(fd, fd_out)
+        except OSError:
+            pass
+        else:
+            return "hardlink"
+
+    with open(fd, "rb") as src, open(fd_out, "xb") as dst:
+        if _clone_file(src, dst):
+            method = "reflink"
+        else:
+            _copy_file_data(src, dst, 0, os.fstat(src.fileno()).st_size)
+            method = "copy"
+    shutil.copystat(fd, fd_out)
+    return method
+
+
 def write_edf_data(fd, data_records):
     """Function to check and fix edf files according to EDF plus standards
 
+    The data records are appended in chunks of about COPY_BUFSIZE bytes. To
+    write a file whose size is known from its header, EdfWriter avoids the
+    separate header and data calls.
+
     Args:
         fd (str): (Relative) path to file to write.
         data_records (array): Variable with data_records to write to edf file\
@@ -253,15 +1377,168 @@ def write_edf_data(fd, data_records):
     if isinstance(fd, str):
         opened = True
         fd = open(fd, "ab")
-        for data_record in data_records:
-            for signal in data_record:
-                signal.tofile(fd)
-    # try:
+
+    chunk = []
+    chunk_size = 0
+    for data_record in data_records:
+        chunk.extend(data_record)
+        chunk_size += sum(signal.nbytes for signal in data_record)
+        if chunk_size >= COPY_BUFSIZE:
+            np.concatenate(chunk).tofile(fd)
+            chunk = []
+            chunk_size = 0
+    if chunk:
+        np.concatenate(chunk).tofile(fd)
 
     if opened:
         fd.close()
 
 
+def _preallocate(f, size):
+    try:
+        os.posix_fallocate(f.fileno(), 0, size)
+    except (AttributeError, OSError):
+        f.truncate(size)
+
+
+class EdfWriter:
+    """
+    Writes an EDF file whose size is known from its header.
+
+    The file is created with the encoded header, preallocated to its final
+    size, and its data section is filled through a writable memory map.
+    Records can be written in any order, so several processes can fill
+    different record ranges of the same file: create it once with mode "w",
+    then open it with mode "r+" in every worker.
+
+    Args:
+        fd (str): (Relative) path to file to write.
+        header (Header): The header of the file.
+        mode (str, optional): "w" to create the file, "r+" to open a file
+            created earlier by an EdfWriter. Defaults to "w".
+
+    Raises:
+        ValueError: If mode is "r+" and the size of the file does not match
+            the header.
+    """
+
+    def __init__(self, fd, header, mode="w"):
+        self.header = header
+        self.samples_per_record = [
+            signal.nr_of_samples_in_each_data_record for signal in header.signals
+        ]
+        data_offset = HEADER_SIZE + header.number_of_signals * SIGNAL_HEADER_SIZE
+        size = (
+            data_offset
+            + header.number_of_data_records * data_record_length(header) * INT_SIZE
+        )
+
+        if mode == "w":
+            with open(fd, "wb") as f:
+                _preallocate(f, size)
+                f.write(encode_edf_header(header))
+        elif mode == "r+":
+            if os.path.getsize(fd) != size:
+                raise ValueError(
+                    f"{fd} has {os.path.getsize(fd)} bytes, header needs {size}"
+                )
+        else:
+            raise ValueError(f"Unknown mode: {mode}")
+
+        self.data = memmap_edf_data(fd, header, mode="r+")
+        self.views = get_signal_views(self.data, header)
+
+    def write_records(self, start, records):
+        """
+        Writes data records, laid out as in the data section of an EDF file.
+
+        Args:
+            start (int): The index of the first data record to write.
+            records (np.ndarray): Array of shape (records, data_record_length).
+        """
+        self.data[start : start + len(records)] = records
+
+    def write_signals(self, start, signals):
+        """
+        Writes the samples of every signal for a range of data records.
+
+        Args:
+            start (int): The index of the first data record to write.
+            signals (list): One array per signal, either one dimensional or of
+                shape (records, nr_of_samples_in_each_data_record), holding
+                whole data records.
+        """
+        for view, signal, spr in zip(
+            self.views, signals, self.samples_per_record, strict=True
+        ):
+            records = np.reshape(signal, (-1, spr))
+            view[start : start + len(records)] = records
+
+    def close(self):
+        """
+        Flushes the data to the file and releases the memory map.
+        """
+        if isinstance(self.data, np.memmap):
+            self.data.flush()
+        self.data = None
+        self.views = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def check_header_dates(header):
+    """
+    Checks the separators of the start date and time in the header.
+
+    Args:
+        header (Header): The EDF header object containing information about the data.
+
+    Returns:
+        list: A message for every field that contains a colon.
+    """
+    return [
+        f"{name} {getattr(header, field)} contains colon (:)"
+        for name, field in (
+            ("start date", "startdate_of_recording"),
+            ("start time", "starttime_of_recording"),
+        )
+        if ":" in getattr(header, field)
+    ]
+
+
+def check_signal_headers(header):
+    """
+    Checks the physical and digital ranges of every signal in the header.
+
+    Args:
+        header (Header): The EDF header object containing information about the data.
+
+    Returns:
+        list: A message for every problem found.
+    """
+    messages = []
+    for signal in header.signals:
+        if signal.physical_maximum <= signal.physical_minimum:
+            messages.append(
+                f"channel {signal.label}: physical maximum "
+                f"({signal.physical_maximum}) is smaller or equal "
+                f"to physical minimum ({signal.physical_minimum})"
+            )
+
+        if signal.digital_maximum <= signal.digital_minimum:
+            messages.append(
+                f"channel {signal.label}: digital maximum "
+                f"({signal.digital_maximum}) is smaller or equal "
+                f"to digital minimum ({signal.digital_minimum})"
+            )
+
+    return messages
+
+
 def fix_edf_header(fd):
     """
     Fix the EDF header.
@@ -278,52 +1555,36 @@ def fix_edf_header(fd):
     else:
         print(f"fixing header for {fd} ... ", end="", flush=True)
 
-    header = read_edf_header(fd)
-    data = read_edf_data(fd, header)
+    replay_header_journal(fd)
+    header = decode_edf_header(*read_raw_edf_header(fd))
 
     something_to_fix = False
-    if ":" in header.startdate_of_recording:
-        warnings.warn(
-            f"start date {header.startdate_of_recording} "
-            "contains colon (:), changing to dot (.)"
-        )
+    date_messages = check_header_dates(header)
+    for message in date_messages:
+        warnings.warn(f"{message}, changing to dot (.)")
+    if date_messages:
         header = header._replace(
-            startdate_of_recording=header.startdate_of_recording.replace(":", ".")
+            startdate_of_recording=header.startdate_of_recording.replace(":", "."),
+            starttime_of_recording=header.starttime_of_recording.replace(":", "."),
         )
         something_to_fix = True
 
-    if ":" in header.starttime_of_recording:
+    n_records, remainder = count_data_records(fd, header)
+    if data_record_length(header) and header.number_of_data_records != n_records:
         warnings.warn(
-            f"start time {header.starttime_of_recording}"
-            "contains colon (:), changing to dot (.)"
-        )
-        header = header._replace(
-            starttime_of_recording=header.starttime_of_recording.replace(":", ".")
+            f"number of data records {header.number_of_data_records} does not "
+            f"match the file size, changing to {n_records}"
         )
+        header = header._replace(number_of_data_records=n_records)
         something_to_fix = True
+    if remainder:
+        warnings.warn(f"the last {remainder} bytes are an incomplete data record")
 
-    for signal in header.signals:
-        if signal.physical_maximum <= signal.physical_minimum:
-            warnings.warn(
-                f"channel {signal.label}: physical maximum "
-                f"({signal.physical_maximum}) is smaller or equal "
-                f"to physical minimum ({signal.physical_minimum})"
-            )
-
-        if signal.digital_maximum <= signal.digital_minimum:
-            warnings.warn(
-                f"channel {signal.label}: digital maximum "
-                f"({signal.digital_maximum}) is smaller or equal "
-                f"to digital minimum ({signal.digital_minimum})"
-            )
+    for message in check_signal_headers(header):
+        warnings.warn(message)
 
     if something_to_fix:
-        tmp_fd = fd + "tmp"
-        write_edf_header(tmp_fd, header)
-        write_edf_data(tmp_fd, data)
-
-        assert os.path.getsize(tmp_fd) == os.path.getsize(fd)
-        os.replace(tmp_fd, fd)
+        rewrite_edf_header(fd, header)
 
     print("done")
 
@@ -350,15 +1611,15 @@ def get_patient_age(header):
 
     # parse the dates
     try:
-        birthdate = dateparser.parse(birthdate, date_formats=["%d-%b-%Y"])
+        birthdate = _parse_date(birthdate, "%d-%b-%Y")
     except ValueError as err:
         raise ValueError(f"Wrong formatting of birthdate: {birthdate}") from err
     try:
-        recdate = dateparser.parse(recdate, date_formats=["%d-%b-%Y"])
+        recdate = _parse_date(recdate, "%d-%b-%Y")
     except ValueError as err:
         raise ValueError(f"Wrong formatting of recording startdate: {recdate}") from err
     try:
-        startdate = dateparser.parse(startdate, date_formats=["%d.%m.%y"])
+        startdate = _parse_date(startdate, "%d.%m.%y")
     except ValueError as err:
         raise ValueError(f"Wrong formatting of startdate: {startdate}") from err
     # check consistency
@@ -372,13 +1633,15 @@ def get_patient_age(header):
     return age_in_days
 
 
-def anonymize_edf_header(fd):
+def anonymize_edf_header(fd, fd_out=None, hasher=None):
     """
-    Anonymizes an EDF file's header fields according to ENSEMBLE and BIDS standards and writes the result to a new file with '_ANONYMIZED' appended to the filename.
+    Anonymizes an EDF file's header fields according to ENSEMBLE and BIDS standards and writes the result to a new file with '_ANONYMIZED' appended to the filename, or to fd_out if given.
 
     The function replaces patient and recording identifiers with anonymized values and recalculates the recording start date based on a fixed reference date (1985-01-01) plus the patient's age. This reference date of 1985-01-01 is a widely adopted convention in the EDF community for pseudonymization purposes, not a requirement of the EDF standard itself. This approach preserves relative temporal relationships while anonymizing actual dates to ensure privacy.
 
     The original data is preserved, but all identifying information in the header is removed or replaced to ensure privacy.
+
+    If a hashlib hasher is given, it is updated with the data section while it is copied, see rewrite_edf_header.
     """
     if not (os.path.isfile(fd)):
         raise FileNotFoundError(fd)
@@ -386,7 +1649,6 @@ def anonymize_edf_header(fd):
         print(f"anonymizing {fd} ... ", end="", flush=True)
 
     header = read_edf_header(fd)
-    data = read_edf_data(fd, header)
 
     filename = os.path.splitext(os.path.basename(fd))[0]
     ext = os.path.splitext(os.path.basename(fd))[1]
@@ -424,9 +1686,9 @@ def anonymize_edf_header(fd):
         # starttime_of_recording=anonymized_starttime,
     )
 
-    fd_out = os.path.join(folder, filename + "_ANONYMIZED" + ext)
-    write_edf_header(fd_out, header)
-    write_edf_data(fd_out, data)
+    if fd_out is None:
+        fd_out = os.path.join(folder, filename + "_ANONYMIZED" + ext)
+    rewrite_edf_header(fd, header, fd_out, hasher)
 
     print("done")
 
@@ -466,8 +1728,7 @@ def rename_for_ensemble(fd):
         # check type of session
         ses = get_session_type()
 
-        split_new_filename = [subject_code, ses, acq, "run-1_eeg.edf"]
-        new_filename = "_".join(split_new_filename)
+        new_filename = make_ensemble_filename(subject_code, ses, acq)
 
         print(f"new filename is {new_filename}")
         correct_filename = input("Is this correct? [Y/n]: ")
@@ -485,20 +1746,36 @@ def rename_for_ensemble(fd):
     if os.path.isfile(new_filename):
         print("File already exists, not overwriting")
     else:
-        shutil.copy(fd, new_filename)
+        copy_edf_file(fd, new_filename)
 
 
-def combine_aeeg_channels(fd_left, fd_right, new_filename="two_channel_aeeg"):
+def combine_aeeg_channels(
+    fd_left,
+    fd_right,
+    new_filename="two_channel_aeeg",
+    on_length_mismatch="truncate",
+    chunk_records=CHUNK_RECORDS,
+):
     """
     Combine left and right aEEG channels into a single edf file.
 
+    The combined file holds the signals of fd_left, except its EDF
+    Annotations, followed by all signals of fd_right, see combine_edf_files.
+
     Args:
         fd_left (str): The file path of the left aEEG channel.
         fd_right (str): The file path of the right aEEG channel.
         new_filename (str, optional): The name of the new combined file. Defaults to "two_channel_aeeg".
+        on_length_mismatch (str, optional): What to do if both files contain a
+            different number of data records: "truncate" to the shortest file
+            with a warning, or "error". Defaults to "truncate".
+        chunk_records (int, optional): The number of data records combined at
+            once. Defaults to CHUNK_RECORDS.
 
     Raises:
         FileNotFoundError: If fd_left or fd_right is not a valid file path.
+        ValueError: If the number of data records differs and
+            on_length_mismatch is "error".
     """
     if not os.path.isfile(fd_left):
         raise FileNotFoundError(fd_left)
@@ -512,58 +1789,126 @@ def combine_aeeg_channels(fd_left, fd_right, new_filename="two_channel_aeeg"):
     output_dir = os.path.dirname(fd_left)
     path_to_file = os.path.join(output_dir, new_filename + ".edf")
 
-    hdr_left = read_edf_header(fd_left)
-    hdr_right = read_edf_header(fd_right)
-
-    opened = False
-    if isinstance(fd_left, str):
-        opened = True
-        fd = open(fd_left, "rb")
+    combine_edf_files(
+        [fd_left, fd_right], path_to_file, on_length_mismatch, chunk_records
+    )
 
-    # create new header by combining left and right channel headers, get the
-    # annotation channel from right channel
-    header = [func(fd, size, name) for name, size, func in HEADER]
+    print("done")
 
-    # create new signal headers
-    signal_headers_left = [hdr_left.signals[0]]
-    signal_headers_right = list(hdr_right.signals)
-    signal_headers = signal_headers_left + signal_headers_right
-    header[-1] = len(signal_headers)
-    header.append(tuple(starmap(SignalHeader, signal_headers)))
 
-    # calculate new header length
-    header_length = HEADER_SIZE + len(signal_headers) * SIGNAL_HEADER_SIZE
-    header[5] = header_length
+def _combine_spans(headers):
+    """
+    Works out which bytes of every input data record go where in a combined
+    data record.
 
-    # read in data from both left and right channels, read - if possible -
-    # annotation channel from right channel edf file
-    labels_left = [signal.label for signal in hdr_left.signals]
-    chans = list(range(hdr_left.number_of_signals))
-    if "EDF Annotations" in labels_left:
-        chans.remove(labels_left.index("EDF Annotations"))
+    Every input keeps all its signals, except that EDF Annotations are only
+    kept from the last input. Adjacent kept signals are merged into one span.
 
-    data_left = list(read_edf_data(fd_left, hdr_left, chans=chans))
-    data_right = list(read_edf_data(fd_right, hdr_right))
+    Returns:
+        tuple: The kept signal headers, and (input index, source byte offset,
+            destination byte offset, number of bytes) spans.
+    """
+    signals = []
+    spans = []
+    destination = 0
+    for i, header in enumerate(headers):
+        offsets = signal_offsets(header) * INT_SIZE
+        for chan, signal in enumerate(header.signals):
+            if signal.label == "EDF Annotations" and i < len(headers) - 1:
+                continue
+            size = int(offsets[chan + 1] - offsets[chan])
+            if (
+                spans
+                and spans[-1][0] == i
+                and spans[-1][1] + spans[-1][3] == offsets[chan]
+            ):
+                last = spans[-1]
+                spans[-1] = (i, last[1], last[2], last[3] + size)
+            else:
+                spans.append((i, int(offsets[chan]), destination, size))
+            signals.append(signal)
+            destination += size
+    return signals, spans
+
+
+def combine_edf_files(
+    fds, fd_out, on_length_mismatch="truncate", chunk_records=CHUNK_RECORDS
+):
+    """
+    Combines the signals of several EDF files into one file.
 
-    # append channels
-    data_all = append_channels(data_left, data_right)
+    The signals of every file are combined in order. EDF Annotations are only
+    kept from the last file. The header is that of the first file, with the
+    combined signals and, if they include EDF Annotations, the EDF+ marker of
+    the last file. The data is spliced at the byte level: for every run of
+    adjacent signals, the same byte span of every data record is copied from
+    the memory-mapped input into the memory-mapped output, chunk_records data
+    records at a time, without decoding any sample.
 
-    write_edf_header(path_to_file, Header(*header))
-    write_edf_data(path_to_file, data_all)
+    Args:
+        fds (list): (Relative) paths to the EDF files to combine.
+        fd_out (str): (Relative) path to the combined file.
+        on_length_mismatch (str, optional): What to do if the files contain a
+            different number of data records: "truncate" to the shortest file
+            with a warning, or "error". Defaults to "truncate".
+        chunk_records (int, optional): The number of data records copied at
+            once. Defaults to CHUNK_RECORDS.
 
-    if opened:
-        fd.close()
+    Raises:
+        FileNotFoundError: If one of fds is not a valid file path.
+        ValueError: If the data records of the files have a different
+            duration, or a different number and on_length_mismatch is "error".
 
-    print("done")
+    Returns:
+        Header: The header of the combined file.
+    """
+    for fd in fds:
+        if not os.path.isfile(fd):
+            raise FileNotFoundError(fd)
+    if on_length_mismatch not in {"truncate", "error"}:
+        raise ValueError(f"Unknown on_length_mismatch: {on_length_mismatch}")
+
+    headers = [read_edf_header(fd) for fd in fds]
+    durations = {header.duration_of_a_data_record for header in headers}
+    if len(durations) > 1:
+        raise ValueError(f"Data records of different duration: {sorted(durations)}")
+
+    n_records = min(header.number_of_data_records for header in headers)
+    if any(header.number_of_data_records != n_records for header in headers):
+        message = ", ".join(
+            f"{os.path.basename(fd)} has {header.number_of_data_records} data records"
+            for fd, header in zip(fds, headers, strict=True)
+        )
+        if on_length_mismatch == "error":
+            raise ValueError(message)
+        warnings.warn(f"{message}, truncating to {n_records} data records")
+
+    signals, spans = _combine_spans(headers)
+    # the kept EDF Annotations come with the EDF+C or EDF+D marker of their file
+    has_annotations = any(signal.label == "EDF Annotations" for signal in signals)
+    header = headers[0]._replace(
+        reserved=read_edf_reserved(fds[-1]) if has_annotations else None,
+        number_of_bytes_in_header_record=HEADER_SIZE
+        + len(signals) * SIGNAL_HEADER_SIZE,
+        number_of_data_records=n_records,
+        number_of_signals=len(signals),
+        signals=tuple(signals),
+    )
 
+    inputs = [
+        memmap_edf_data(fd, hdr, end=n_records).view(np.uint8)
+        for fd, hdr in zip(fds, headers, strict=True)
+    ]
+    with EdfWriter(fd_out, header) as writer:
+        output = writer.data.view(np.uint8)
+        for start in range(0, n_records, chunk_records):
+            stop = min(start + chunk_records, n_records)
+            for i, source, destination, size in spans:
+                output[start:stop, destination : destination + size] = inputs[i][
+                    start:stop, source : source + size
+                ]
 
-def append_channels(data_left, data_right):
-    """
-    This function takes two lists of data and appends the corresponding elements from the second list to the elements in the first list. It yields the appended elements.
-    """
-    for elements_left, elements_right in zip(data_left, data_right, strict=True):
-        elements_left.extend(elements_right)
-        yield elements_left
+    return header
 
 
 def check_filename_ensemble(filename):
@@ -594,6 +1939,78 @@ def check_filename_ensemble(filename):
     return do_renaming
 
 
+def is_valid_code_part(value, n_digits):
+    """
+    Checks one part of a subject code: a string of exactly n_digits digits.
+    """
+    return _is_digits(value, n_digits)
+
+
+def make_subject_code(centre_code, subject_number, sibling_number):
+    """
+    Builds the ENSEMBLE subject code sub-<centre>E<subject><sibling>.
+
+    Args:
+        centre_code (str): Three digits.
+        subject_number (str): Five digits.
+        sibling_number (str): A single digit.
+
+    Raises:
+        ValueError: If a part does not have the required number of digits.
+
+    Returns:
+        str: The subject code.
+    """
+    if not is_valid_code_part(centre_code, 3):
+        raise ValueError("Centre code must consist of three digits")
+    if not is_valid_code_part(subject_number, 5):
+        raise ValueError("Subject number must consist of five digits")
+    if not is_valid_code_part(sibling_number, 1):
+        raise ValueError("Sibling number must consist of a single digit")
+
+    return "sub-" + centre_code + "E" + subject_number + sibling_number
+
+
+def infer_acquisition_type(header):
+    """
+    Determines the acquisition type from the number of signals: files with
+    at most 4 signals are aEEG, others cEEG.
+
+    Args:
+        header: The header information of the file, e.g. from read_edf_header
+            or catalog.load_header.
+
+    Returns:
+        str: "acq-aeeg" or "acq-ceeg".
+    """
+    return "acq-aeeg" if header.number_of_signals <= 4 else "acq-ceeg"
+
+
+def parse_session_type(ses):
+    """
+    Parses a session type: (d)iag or (f)ollowup, case insensitive.
+
+    Returns:
+        str: "ses-diag" or "ses-term", or None if ses is not recognized.
+    """
+    ses = ses.strip().lower()
+    if ses in {"d", "diag", "ses-diag"}:
+        return "ses-diag"
+    elif ses in {"f", "followup", "term", "ses-term"}:
+        return "ses-term"
+    return None
+
+
+def make_ensemble_filename(subject_code, ses, acq):
+    """
+    Builds the ENSEMBLE and BIDS filename of a recording.
+
+    Returns:
+        str: e.g. sub-001E000011_ses-diag_acq-aeeg_run-1_eeg.edf
+    """
+    return f"{subject_code}_{ses}_{acq}_run-1_eeg.edf"
+
+
 def get_subject_code():
     """
     Helper code to get subject code with user input
@@ -602,7 +2019,7 @@ def get_subject_code():
     # Get centre code
     while True:
         centre_code = input("Please input your centre code [xxx]: ")
-        if len(centre_code) != 3 or not centre_code.isdigit():
+        if not is_valid_code_part(centre_code, 3):
             print("Centre code must consist of three digits")
             continue
         break
@@ -610,7 +2027,7 @@ def get_subject_code():
     # Get subject number
     while True:
         subject_number = input("Please input your subject number [xxxxx]: ")
-        if len(subject_number) != 5 or not subject_number.isdigit():
+        if not is_valid_code_part(subject_number, 5):
             print("Subject number must consist of five digits")
             continue
         break
@@ -618,12 +2035,12 @@ def get_subject_code():
     # Get sibling number
     while True:
         sibling_number = input("Please input the sibling number [x]: ")
-        if len(sibling_number) != 1 or not sibling_number.isdigit():
+        if not is_valid_code_part(sibling_number, 1):
             print("Sibling number must consist of a single digit")
             continue
         break
 
-    subject_code = "sub-" + centre_code + "E" + subject_number + sibling_number
+    subject_code = make_subject_code(centre_code, subject_number, sibling_number)
 
     return subject_code
 
@@ -639,8 +2056,8 @@ def get_acquisition_type(header):
         acq: The determined acquisition type.
     """
     # Check number of signals in file
-    if header.number_of_signals <= 4:
-        acq = "acq-aeeg"
+    acq = infer_acquisition_type(header)
+    if acq == "acq-aeeg":
         print("file automatically determined to be aEEG")
         correct_acq = input("is this correct? [Y/n]: ").lower()
 
@@ -648,7 +2065,6 @@ def get_acquisition_type(header):
             acq = "acq-ceeg"
 
     else:
-        acq = "acq-ceeg"
         print("file automatically determined to be cEEG")
         correct_acq = input("is this correct? [Y/n]: ").lower()
 
@@ -666,12 +2082,8 @@ def get_session_type():
         ses_string = (
             "During which session was this recordig taken? " + "[(d)iag/(f)ollowup]: "
         )
-        ses = input(ses_string).lower()
-        if ses in {"d", "diag"}:
-            ses = "ses-diag"
-            break
-        elif ses in {"f", "followup"}:
-            ses = "ses-term"
+        ses = parse_session_type(input(ses_string))
+        if ses is not None:
             break
 
     return ses
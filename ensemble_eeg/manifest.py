@@ -0,0 +1,73 @@
+import json
+import os
+
+MANIFEST_FILENAME = "anonymize_manifest.jsonl"
+
+
+def read_manifest(manifest_path):
+    """
+    Reads a manifest written by anonymize_eeg_ensemble.
+
+    Args:
+        manifest_path (str): Path to the JSON lines manifest.
+
+    Returns:
+        dict: The latest entry of every input path. Empty if the manifest
+            does not exist.
+    """
+    entries = {}
+    if not os.path.isfile(manifest_path):
+        return entries
+    with open(manifest_path) as f:
+        for line in f:
+            # a run that was killed can leave a truncated last line
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            entries[entry["input"]] = entry
+    return entries
+
+
+def open_manifest(manifest_path):
+    """
+    Opens a manifest for appending entries, one JSON object per line.
+
+    A truncated last line left by a run that was killed is terminated first,
+    so the next entry starts on a line of its own.
+
+    Args:
+        manifest_path (str): Path to the JSON lines manifest.
+
+    Returns:
+        file object: The manifest, opened for appending.
+    """
+    manifest_file = open(manifest_path, "a")
+    if os.path.getsize(manifest_path):
+        with open(manifest_path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                manifest_file.write("\n")
+    return manifest_file
+
+
+def is_done(entry, eeg_path):
+    """
+    Checks whether a manifest entry records a successful run on the current
+    version of eeg_path.
+
+    Args:
+        entry (dict): The manifest entry of eeg_path, or None.
+        eeg_path (str): The input file.
+
+    Returns:
+        bool: Whether the run succeeded, eeg_path did not change since, and
+            the output still exists.
+    """
+    if entry is None or entry["status"] != "done":
+        return False
+    stat = os.stat(eeg_path)
+    return (stat.st_size, stat.st_mtime_ns) == (
+        entry["size"],
+        entry["mtime_ns"],
+    ) and os.path.isfile(entry["output"])
@@ -0,0 +1,228 @@
+import csv
+import json
+import os
+
+import numpy as np
+
+from ensemble_eeg import ensemble_edf
+
+HISTOGRAM_BINS = 64
+REPORT_COLUMNS = (
+    "label",
+    "physical_dimension",
+    "sample_rate",
+    "n_samples",
+    "min",
+    "max",
+    "mean",
+    "std",
+    "percent_clipped",
+    "longest_flatline_samples",
+    "longest_flatline_seconds",
+)
+
+
+class _SignalStats:
+    """
+    Running statistics of the digital values of one signal.
+
+    Sums are kept as Python integers, so mean and variance are exact no
+    matter how long the recording is.
+    """
+
+    def __init__(self, signal, bins):
+        self.signal = signal
+        self.bins = bins
+        self.n = 0
+        self.min = None
+        self.max = None
+        self.sum = 0
+        self.sum_of_squares = 0
+        self.n_clipped = 0
+        self.histogram = np.zeros(bins, dtype=np.int64)
+        self.last = None
+        self.run = 0
+        self.longest_run = 0
+
+    def update(self, x):
+        if len(x) == 0:
+            return
+        digital_minimum = self.signal.digital_minimum
+        digital_maximum = self.signal.digital_maximum
+        x64 = x.astype(np.int64)
+
+        self.n += len(x)
+        chunk_min = int(x.min())
+        chunk_max = int(x.max())
+        self.min = chunk_min if self.min is None else min(self.min, chunk_min)
+        self.max = chunk_max if self.max is None else max(self.max, chunk_max)
+        self.sum += int(x64.sum())
+        self.sum_of_squares += int(np.dot(x64, x64))
+        self.n_clipped += int(
+            np.count_nonzero((x <= digital_minimum) | (x >= digital_maximum))
+        )
+
+        # histogram over the digital range, values outside it go to the edges
+        width = digital_maximum - digital_minimum + 1
+        if width > 0:
+            index = (x64 - digital_minimum) * self.bins // width
+            np.clip(index, 0, self.bins - 1, out=index)
+            self.histogram += np.bincount(index, minlength=self.bins)
+
+        # flatlines: runs of identical consecutive values, carried over chunks
+        starts = np.flatnonzero(x[1:] != x[:-1]) + 1
+        lengths = np.diff(starts, prepend=0, append=len(x))
+        if self.run and x[0] == self.last:
+            lengths[0] += self.run
+        self.longest_run = max(self.longest_run, int(lengths.max()))
+        self.last = x[-1]
+        self.run = int(lengths[-1])
+
+    def result(self, gain, offset, sample_rate):
+        result = {
+            "label": self.signal.label,
+            "physical_dimension": self.signal.physical_dimension,
+            "sample_rate": sample_rate,
+            "n_samples": self.n,
+        }
+        if self.n == 0:
+            return result
+
+        mean = self.sum / self.n
+        variance = (self.n * self.sum_of_squares - self.sum**2) / self.n**2
+        low, high = sorted((gain * self.min + offset, gain * self.max + offset))
+        width = self.signal.digital_maximum - self.signal.digital_minimum + 1
+        edges = (
+            self.signal.digital_minimum + np.arange(self.bins + 1) * width / self.bins
+        )
+
+        result.update(
+            {
+                "min": low,
+                "max": high,
+                "mean": gain * mean + offset,
+                "std": abs(gain) * variance**0.5,
+                "percent_clipped": 100 * self.n_clipped / self.n,
+                "longest_flatline_samples": self.longest_run,
+                "longest_flatline_seconds": self.longest_run / sample_rate
+                if sample_rate
+                else None,
+                "histogram_counts": self.histogram.tolist(),
+                "histogram_edges": (gain * edges + offset).tolist(),
+            }
+        )
+        return result
+
+
+def compute_signal_stats(
+    fd,
+    header=None,
+    chans=None,
+    chunk_records=ensemble_edf.CHUNK_RECORDS,
+    bins=HISTOGRAM_BINS,
+):
+    """
+    Computes per-channel statistics of an EDF file in a single pass.
+
+    The data section is streamed once in chunks of chunk_records data
+    records, so memory use does not depend on the length of the recording.
+
+    Args:
+        fd (str): (Relative) path to the EDF file.
+        header (Header, optional): The header of the file. Defaults to None,
+            which reads it from fd.
+        chans (str or list, optional): The indices and/or labels of the
+            signals. Defaults to None, which uses every signal except EDF
+            Annotations.
+        chunk_records (int, optional): The number of data records per chunk.
+            Defaults to ensemble_edf.CHUNK_RECORDS.
+        bins (int, optional): The number of histogram bins spanning the
+            digital range of each signal. Defaults to HISTOGRAM_BINS.
+
+    Returns:
+        list: One dict per signal with its minimum, maximum, mean and standard
+            deviation in physical units, the percentage of samples clipped at
+            the digital minimum or maximum, the longest flatline, and an
+            amplitude histogram.
+    """
+    if header is None:
+        header = ensemble_edf.read_edf_header(fd)
+    if chans is None:
+        chans = ensemble_edf.get_data_channel_indices(header)
+    chans = ensemble_edf.get_channel_indices(header, chans)
+
+    data = ensemble_edf.memmap_edf_data(fd, header)
+    views = ensemble_edf.get_signal_views(data, header, chans)
+    stats = [_SignalStats(header.signals[chan], bins) for chan in chans]
+
+    for start in range(0, len(data), chunk_records):
+        for view, signal_stats in zip(views, stats, strict=True):
+            signal_stats.update(view[start : start + chunk_records].reshape(-1))
+
+    results = []
+    for chan, signal_stats in zip(chans, stats, strict=True):
+        signal = header.signals[chan]
+        try:
+            gain, offset = ensemble_edf.get_gain_offset(header, [chan])
+            gain, offset = float(gain[0]), float(offset[0])
+        except ValueError:
+            gain, offset = 1.0, 0.0
+        sample_rate = (
+            signal.nr_of_samples_in_each_data_record / header.duration_of_a_data_record
+        )
+        results.append(signal_stats.result(gain, offset, sample_rate))
+
+    return results
+
+
+def qc_report(fd, out=None, chunk_records=ensemble_edf.CHUNK_RECORDS):
+    """
+    Runs the quality checks of an EDF file and optionally writes a report.
+
+    The report contains the header problems that fix_edf_header warns about
+    and the per-channel statistics of compute_signal_stats.
+
+    Args:
+        fd (str): (Relative) path to the EDF file.
+        out (str, optional): Path of the report. A .tsv extension writes one
+            row per channel without the histograms, anything else writes
+            JSON. Defaults to None, which does not write a report.
+        chunk_records (int, optional): The number of data records per chunk.
+            Defaults to ensemble_edf.CHUNK_RECORDS.
+
+    Returns:
+        dict: The report.
+    """
+    if not os.path.isfile(fd):
+        raise FileNotFoundError(fd)
+
+    header = ensemble_edf.decode_edf_header(*ensemble_edf.read_raw_edf_header(fd))
+    n_records, _ = ensemble_edf.count_data_records(fd, header)
+
+    header_warnings = ensemble_edf.check_header_dates(header)
+    if header.number_of_data_records != n_records:
+        header_warnings.append(
+            f"number of data records {header.number_of_data_records} does not "
+            f"match the file size, which holds {n_records} data records"
+        )
+        header = header._replace(number_of_data_records=n_records)
+    header_warnings += ensemble_edf.check_signal_headers(header)
+
+    report = {
+        "file": fd,
+        "header_warnings": header_warnings,
+        "signals": compute_signal_stats(fd, header, chunk_records=chunk_records),
+    }
+
+    if out is not None and os.path.splitext(out)[1].lower() == ".tsv":
+        with open(out, "w", newline="") as f:
+            writer = csv.DictWriter(
+                f, REPORT_COLUMNS, delimiter="\t", extrasaction="ignore"
+            )
+            writer.writeheader()
+            writer.writerows(report["signals"])
+    elif out is not None:
+        with open(out, "w") as f:
+            json.dump(report, f, indent=2)
+
+    return report
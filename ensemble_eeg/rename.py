@@ -0,0 +1,216 @@
+import csv
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from ensemble_eeg import catalog, ensemble_edf
+
+MAPPING_COLUMNS = ("file", "centre", "subject", "sibling", "session")
+PLAN_COLUMNS = ("source", "destination", "acquisition", "status")
+
+
+def read_mapping(mapping_path):
+    """
+    Reads a rename mapping table.
+
+    The table is tab separated if its extension is .tsv, otherwise comma
+    separated. It needs the columns file, centre, subject, sibling and
+    session, and may have an acquisition column (aeeg or ceeg) to overrule
+    the acquisition type inferred from the header. Relative paths in the
+    file column are relative to the directory of the mapping table.
+
+    Args:
+        mapping_path (str): Path to the CSV or TSV file.
+
+    Raises:
+        ValueError: If a required column is missing.
+
+    Returns:
+        list: One dict per row, with the file column as an absolute path.
+    """
+    delimiter = "\t" if mapping_path.lower().endswith(".tsv") else ","
+    base_dir = os.path.dirname(os.path.abspath(mapping_path))
+
+    with open(mapping_path, newline="") as f:
+        reader = csv.DictReader(f, delimiter=delimiter)
+        fieldnames = [name.strip().lower() for name in reader.fieldnames or ()]
+        missing = [column for column in MAPPING_COLUMNS if column not in fieldnames]
+        if missing:
+            raise ValueError(f"{mapping_path} misses the columns {missing}")
+
+        rows = []
+        for row in reader:
+            row = {
+                name: (value or "").strip()
+                for name, value in zip(fieldnames, row.values(), strict=False)
+            }
+            row["file"] = os.path.join(base_dir, os.path.expanduser(row["file"]))
+            rows.append(row)
+
+    return rows
+
+
+def _get_header(path, catalog_path):
+    """Returns the header of path, from the catalog if it is up to date."""
+    if catalog_path is not None:
+        header = catalog.load_header(catalog_path, path)
+        if header is not None:
+            return header
+    return ensemble_edf.read_edf_header(path)
+
+
+def _plan_row(row, output_dir, catalog_path):
+    """Determines the destination of one row of the mapping table."""
+    plan = {
+        "source": row["file"],
+        "destination": None,
+        "acquisition": None,
+        "status": "planned",
+    }
+    try:
+        if not os.path.isfile(row["file"]):
+            raise FileNotFoundError(row["file"])
+
+        subject_code = ensemble_edf.make_subject_code(
+            row["centre"], row["subject"], row["sibling"]
+        )
+        ses = ensemble_edf.parse_session_type(row["session"])
+        if ses is None:
+            raise ValueError(f"Unknown session {row['session']}")
+
+        if row.get("acquisition"):
+            acq = "acq-" + row["acquisition"].lower().removeprefix("acq-")
+            if acq not in {"acq-aeeg", "acq-ceeg"}:
+                raise ValueError(f"Unknown acquisition {row['acquisition']}")
+        else:
+            acq = ensemble_edf.infer_acquisition_type(
+                _get_header(row["file"], catalog_path)
+            )
+    except (OSError, ValueError) as err:
+        plan["status"] = f"error: {err}"
+        return plan
+
+    directory = output_dir or os.path.dirname(row["file"])
+    plan["acquisition"] = acq
+    plan["destination"] = os.path.join(
+        directory,
+        subject_code,
+        ensemble_edf.make_ensemble_filename(subject_code, ses, acq),
+    )
+    if os.path.exists(plan["destination"]):
+        plan["status"] = "exists"
+    return plan
+
+
+def plan_renames(mapping_path, output_dir=None, catalog_path=None, jobs=None):
+    """
+    Works out the ENSEMBLE and BIDS destination of every file in a mapping
+    table, without touching any file.
+
+    The acquisition type is inferred from the number of signals, taken
+    from the header catalog when it holds the file and is up to date, and
+    otherwise from the header of the file.
+
+    Args:
+        mapping_path (str): The mapping table, see read_mapping.
+        output_dir (str, optional): The directory in which the subject
+            directories are created. Defaults to None, which uses the
+            directory of every source file, like rename_for_ensemble.
+        catalog_path (str, optional): Path to a catalog built with
+            catalog.build_catalog. Defaults to None.
+        jobs (int, optional): The number of threads reading headers.
+            Defaults to None, which lets ThreadPoolExecutor choose.
+
+    Returns:
+        list: One dict per row with the source, destination, acquisition type
+            and status: "planned", "exists" if the destination already
+            exists, "duplicate" if another row has the same destination, or
+            "error: ..." if the row is invalid.
+    """
+    rows = read_mapping(mapping_path)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        plan = list(
+            executor.map(lambda row: _plan_row(row, output_dir, catalog_path), rows)
+        )
+
+    destinations = {}
+    for entry in plan:
+        if entry["destination"] is None:
+            continue
+        if entry["destination"] in destinations:
+            entry["status"] = "duplicate"
+        else:
+            destinations[entry["destination"]] = entry
+
+    return plan
+
+
+def _execute(entry, link):
+    os.makedirs(os.path.dirname(entry["destination"]), exist_ok=True)
+    try:
+        method = ensemble_edf.copy_edf_file(entry["source"], entry["destination"], link)
+    except FileExistsError:
+        return "exists"
+    except OSError as err:
+        return f"error: {err}"
+    return method
+
+
+def bulk_rename_for_ensemble(
+    mapping_path,
+    output_dir=None,
+    catalog_path=None,
+    dry_run=False,
+    link=False,
+    plan_path=None,
+    jobs=None,
+):
+    """
+    Renames many files according to ENSEMBLE and BIDS standards, without
+    prompting, from a mapping table.
+
+    Like rename_for_ensemble, every file is copied to
+    <directory>/<subject code>/<new filename> and existing files are not
+    overwritten. Files are copied concurrently. When source and
+    destination share a filesystem that supports it, the destination is a
+    reflink, so no data is copied but both files stay independent.
+
+    Args:
+        mapping_path (str): The mapping table, see read_mapping.
+        output_dir (str, optional): See plan_renames.
+        catalog_path (str, optional): See plan_renames.
+        dry_run (bool, optional): Only print (and write) the plan. Defaults to
+            False.
+        link (bool, optional): Hardlink instead of copy when possible.
+            Source and destination are then the same file, so fixing or
+            anonymizing the header of one in place changes the other.
+            Defaults to False.
+        plan_path (str, optional): Write the plan, with the final status of
+            every row, to this TSV file. Defaults to None.
+        jobs (int, optional): The number of threads. Defaults to None, which
+            lets ThreadPoolExecutor choose.
+
+    Returns:
+        list: The plan, see plan_renames. After renaming, the status of every
+            planned row is how it was copied: "hardlink", "reflink" or
+            "copy", or "exists" or "error: ..." if it failed.
+    """
+    plan = plan_renames(mapping_path, output_dir, catalog_path, jobs)
+    todo = [entry for entry in plan if entry["status"] == "planned"]
+
+    if not dry_run:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            for entry, status in zip(
+                todo, executor.map(lambda e: _execute(e, link), todo), strict=True
+            ):
+                entry["status"] = status
+
+    for entry in plan:
+        print(f"{entry['source']} -> {entry['destination']} [{entry['status']}]")
+
+    if plan_path is not None:
+        with open(plan_path, "w", newline="") as f:
+            writer = csv.DictWriter(f, PLAN_COLUMNS, delimiter="\t")
+            writer.writeheader()
+            writer.writerows(plan)
+
+    return plan
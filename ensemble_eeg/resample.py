@@ -0,0 +1,245 @@
+import os
+from fractions import Fraction
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from ensemble_eeg import ensemble_edf
+
+ZERO_CROSSINGS = 10
+KAISER_BETA = 5.0
+
+
+def design_resampling_filter(up, down):
+    """
+    Designs the anti-aliasing filter for resampling by up / down.
+
+    The filter is a Kaiser-windowed sinc at the Nyquist frequency of the
+    lower of both rates, with ZERO_CROSSINGS zero crossings on either side.
+
+    Args:
+        up (int): The upsampling factor.
+        down (int): The downsampling factor.
+
+    Returns:
+        np.ndarray: The filter coefficients at the upsampled rate, scaled by
+            up so that the gain of the resampler is one.
+    """
+    max_rate = max(up, down)
+    half_length = ZERO_CROSSINGS * max_rate
+    n = np.arange(-half_length, half_length + 1)
+    h = np.sinc(n / max_rate) / max_rate * np.kaiser(len(n), KAISER_BETA)
+    return up * h
+
+
+class PolyphaseResampler:
+    """
+    Resamples several signals of the same rate by up / down, chunk by chunk.
+
+    The filter is split into its up polyphase components, so only the
+    output samples are computed and the zeros of the upsampled signal are
+    never multiplied. The last input samples still needed by the filter are
+    carried over to the next chunk, so chunk edges leave no seams, and the
+    delay of the filter is compensated, so output sample m is at time
+    m * down / up input samples.
+
+    Args:
+        up (int): The upsampling factor.
+        down (int): The downsampling factor.
+        n_channels (int): The number of signals resampled together.
+    """
+
+    def __init__(self, up, down, n_channels):
+        self.up = up
+        self.down = down
+        h = design_resampling_filter(up, down)
+        self.delay = (len(h) - 1) // 2
+        self.n_taps = -(-len(h) // up)
+        # polyphase matrix: phase p uses h[p], h[p + up], h[p + 2 up], ...
+        self.phases = np.zeros(up * self.n_taps)
+        self.phases[: len(h)] = h
+        self.phases = self.phases.reshape(self.n_taps, up).T
+
+        # buffer[:, 0] is input sample buffer_start, zeros before the signal
+        self.buffer = np.zeros((n_channels, self.n_taps - 1))
+        self.buffer_start = -(self.n_taps - 1)
+        self.n_in = 0
+        self.n_out = 0
+
+    def process(self, x):
+        """
+        Resamples the next chunk.
+
+        Args:
+            x (np.ndarray): The next samples, of shape (channels, samples).
+
+        Returns:
+            np.ndarray: The output samples completed by this chunk, of shape
+                (channels, samples).
+        """
+        self.buffer = np.concatenate((self.buffer, x), axis=1)
+        self.n_in += x.shape[1]
+
+        # output m needs input samples up to (m * down + delay) // up
+        last = (self.n_in * self.up - 1 - self.delay) // self.down
+        n_out = max(last - self.n_out + 1, 0)
+        y = np.zeros((self.buffer.shape[0], n_out))
+        # a short chunk may not complete an output sample, nor fill a window
+        if n_out == 0:
+            return y
+
+        # windows[:, j] holds input samples j - n_taps + 1 ... j of the buffer
+        windows = sliding_window_view(self.buffer, self.n_taps, axis=1)
+        for r in range(min(self.up, n_out)):
+            t = (self.n_out + r) * self.down + self.delay
+            phase = self.phases[t % self.up, ::-1]
+            first = t // self.up - self.buffer_start - (self.n_taps - 1)
+            n = len(range(r, n_out, self.up))
+            stop = first + (n - 1) * self.down + 1
+            y[:, r :: self.up] = windows[:, first : stop : self.down] @ phase
+
+        self.n_out += n_out
+        next_input = (self.n_out * self.down + self.delay) // self.up
+        keep_from = next_input - (self.n_taps - 1) - self.buffer_start
+        self.buffer = self.buffer[:, keep_from:]
+        self.buffer_start += keep_from
+        return y
+
+    def flush(self, n_total):
+        """
+        Pushes out the remaining output samples after the last chunk.
+
+        Args:
+            n_total (int): The total number of output samples of the signals.
+
+        Returns:
+            np.ndarray: The remaining output samples, up to n_total.
+        """
+        needed = ((n_total - 1) * self.down + self.delay) // self.up + 1
+        padding = np.zeros((self.buffer.shape[0], max(needed - self.n_in, 0)))
+        y = self.process(padding)
+        return y[:, : y.shape[1] - max(self.n_out - n_total, 0)]
+
+
+def resample_edf(fd, fd_out, sample_rate, chunk_records=ensemble_edf.CHUNK_RECORDS):
+    """
+    Resamples every signal of an EDF file to one sample rate.
+
+    The file is streamed chunk_records data records at a time. Signals of
+    the same rate are resampled together by one PolyphaseResampler, signals
+    already at sample_rate are copied, and EDF Annotations are passed
+    through unchanged, together with the EDF+ marker of the header. The
+    digital values are resampled, rounded and clipped to the digital range,
+    so the calibration in the header stays valid.
+
+    Args:
+        fd (str): (Relative) path to the EDF file.
+        fd_out (str): (Relative) path to the resampled file.
+        sample_rate (float): The new sample rate in Hz. A data record must
+            hold a whole number of samples at this rate.
+        chunk_records (int, optional): The number of data records read at
+            once. Defaults to ensemble_edf.CHUNK_RECORDS.
+
+    Raises:
+        ValueError: If a data record does not hold a whole number of samples
+            at sample_rate.
+
+    Returns:
+        Header: The header of the resampled file.
+    """
+    if not os.path.isfile(fd):
+        raise FileNotFoundError(fd)
+
+    header = ensemble_edf.read_edf_header(fd)
+    # the decimal text, as the binary value of e.g. 0.1 s is not a tenth
+    samples_per_record = Fraction(str(sample_rate)) * Fraction(
+        str(header.duration_of_a_data_record)
+    )
+    if samples_per_record.denominator != 1:
+        raise ValueError(
+            f"A data record of {header.duration_of_a_data_record} s does not "
+            f"hold a whole number of samples at {sample_rate} Hz"
+        )
+    samples_per_record = int(samples_per_record)
+
+    # group the signals by their number of samples per data record
+    groups = {}
+    signals = []
+    for chan, signal in enumerate(header.signals):
+        if signal.label == "EDF Annotations":
+            signals.append(signal)
+            continue
+        groups.setdefault(signal.nr_of_samples_in_each_data_record, []).append(chan)
+        signals.append(
+            signal._replace(nr_of_samples_in_each_data_record=samples_per_record)
+        )
+    # keep the EDF+C or EDF+D marker, which the decoded header discards
+    out_header = header._replace(
+        reserved=ensemble_edf.read_edf_reserved(fd), signals=tuple(signals)
+    )
+
+    resamplers = {}
+    for spr, chans in groups.items():
+        ratio = Fraction(samples_per_record, spr)
+        if ratio != 1:
+            resamplers[spr] = PolyphaseResampler(
+                ratio.numerator, ratio.denominator, len(chans)
+            )
+
+    n_records = header.number_of_data_records
+    data = ensemble_edf.memmap_edf_data(fd, header)
+    views = ensemble_edf.get_signal_views(data, header)
+    limits = [
+        (signal.digital_minimum, signal.digital_maximum) for signal in header.signals
+    ]
+    pending = [np.empty(0, dtype=ensemble_edf.EDF_DTYPE) for _ in signals]
+    record = 0
+
+    def write(outputs):
+        nonlocal record
+        for chan, samples in outputs:
+            if samples.dtype != ensemble_edf.EDF_DTYPE:
+                samples = np.clip(np.rint(samples), *limits[chan])
+                samples = samples.astype(ensemble_edf.EDF_DTYPE)
+            pending[chan] = np.concatenate((pending[chan], samples))
+
+        n = min(
+            len(p) // signal.nr_of_samples_in_each_data_record
+            for p, signal in zip(pending, signals, strict=True)
+        )
+        writer.write_signals(
+            record,
+            [
+                p[: n * signal.nr_of_samples_in_each_data_record]
+                for p, signal in zip(pending, signals, strict=True)
+            ],
+        )
+        for chan, signal in enumerate(signals):
+            pending[chan] = pending[chan][
+                n * signal.nr_of_samples_in_each_data_record :
+            ]
+        record += n
+
+    with ensemble_edf.EdfWriter(fd_out, out_header) as writer:
+        for start in range(0, n_records, chunk_records):
+            stop = min(start + chunk_records, n_records)
+            outputs = []
+            for chan, signal in enumerate(header.signals):
+                if signal.label == "EDF Annotations" or (
+                    signal.nr_of_samples_in_each_data_record not in resamplers
+                ):
+                    outputs.append((chan, views[chan][start:stop].reshape(-1)))
+            for spr, resampler in resamplers.items():
+                x = np.stack(
+                    [views[chan][start:stop].reshape(-1) for chan in groups[spr]]
+                )
+                outputs.extend(zip(groups[spr], resampler.process(x), strict=True))
+            write(outputs)
+
+        outputs = []
+        for spr, resampler in resamplers.items():
+            y = resampler.flush(n_records * samples_per_record)
+            outputs.extend(zip(groups[spr], y, strict=True))
+        write(outputs)
+
+    return out_header
@@ -0,0 +1,264 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from ensemble_eeg import ensemble_edf
+from ensemble_eeg.manifest import MANIFEST_FILENAME, read_manifest
+
+
+def _aligned_chunk_size(header, chunk_size):
+    """Rounds chunk_size down to a whole number of data records."""
+    record_size = ensemble_edf.data_record_length(header) * ensemble_edf.INT_SIZE
+    if record_size == 0:
+        return chunk_size
+    return max(chunk_size // record_size, 1) * record_size
+
+
+def _iter_data_section(fd, header, chunk_size):
+    """
+    Reads everything after the header of fd in chunks of chunk_size bytes.
+
+    The chunks are views of one reused buffer, valid until the next chunk.
+    """
+    header_length = (
+        ensemble_edf.HEADER_SIZE
+        + header.number_of_signals * ensemble_edf.SIGNAL_HEADER_SIZE
+    )
+    buffer = memoryview(bytearray(chunk_size))
+    with open(fd, "rb", buffering=0) as f:
+        f.seek(header_length)
+        while n := f.readinto(buffer):
+            yield buffer[:n]
+
+
+def hash_data_section(fd, header=None, chunk_size=ensemble_edf.COPY_BUFSIZE):
+    """
+    Computes the BLAKE2b hash of the data section of an EDF file.
+
+    This is the hash that anonymize_eeg_ensemble records in its manifest.
+
+    Args:
+        fd (str): (Relative) path to the EDF file.
+        header (Header, optional): The header of the file. Defaults to None,
+            which reads it from fd.
+        chunk_size (int, optional): The number of bytes read at once, rounded
+            down to whole data records. Defaults to ensemble_edf.COPY_BUFSIZE.
+
+    Returns:
+        str: The hexadecimal digest.
+    """
+    if header is None:
+        header = ensemble_edf.read_edf_header(fd)
+    hasher = hashlib.blake2b()
+    for chunk in _iter_data_section(
+        fd, header, _aligned_chunk_size(header, chunk_size)
+    ):
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def verify_data_section(fd_in, fd_out, chunk_size=ensemble_edf.COPY_BUFSIZE):
+    """
+    Checks that two EDF files, e.g. an input and its anonymized output, have
+    byte-identical data sections.
+
+    Both files are read once, sequentially and in lockstep, in chunks of
+    whole data records, and hashed on the way.
+
+    Args:
+        fd_in (str): (Relative) path to the original EDF file.
+        fd_out (str): (Relative) path to the EDF file to check.
+        chunk_size (int, optional): The number of bytes read at once, rounded
+            down to whole data records. Defaults to ensemble_edf.COPY_BUFSIZE.
+
+    Returns:
+        dict: The paths, whether the data sections match, the BLAKE2b hash of
+            both, and the first data record that differs (None if they match).
+    """
+    header_in = ensemble_edf.read_edf_header(fd_in)
+    header_out = ensemble_edf.read_edf_header(fd_out)
+    chunk_size = _aligned_chunk_size(header_in, chunk_size)
+    record_size = ensemble_edf.data_record_length(header_in) * ensemble_edf.INT_SIZE
+
+    hasher_in = hashlib.blake2b()
+    hasher_out = hashlib.blake2b()
+    chunks_in = _iter_data_section(fd_in, header_in, chunk_size)
+    chunks_out = _iter_data_section(fd_out, header_out, chunk_size)
+    position = 0
+    first_mismatch = None
+
+    while True:
+        chunk_in = next(chunks_in, b"")
+        chunk_out = next(chunks_out, b"")
+        if not chunk_in and not chunk_out:
+            break
+        hasher_in.update(chunk_in)
+        hasher_out.update(chunk_out)
+
+        if first_mismatch is None and chunk_in != chunk_out:
+            n = min(len(chunk_in), len(chunk_out))
+            differs = np.flatnonzero(
+                np.frombuffer(chunk_in, np.uint8, n)
+                != np.frombuffer(chunk_out, np.uint8, n)
+            )
+            first_mismatch = position + (differs[0] if len(differs) else n)
+        position += max(len(chunk_in), len(chunk_out))
+
+    digest_in = hasher_in.hexdigest()
+    digest_out = hasher_out.hexdigest()
+    return {
+        "input": fd_in,
+        "output": fd_out,
+        "match": digest_in == digest_out,
+        "input_blake2b": digest_in,
+        "output_blake2b": digest_out,
+        "first_mismatch_record": None
+        if first_mismatch is None
+        else int(first_mismatch // record_size if record_size else 0),
+    }
+
+
+def verify_combined(
+    fd_left, fd_right, fd_combined, chunk_records=ensemble_edf.CHUNK_RECORDS
+):
+    """
+    Checks that a file written by combine_aeeg_channels holds the signals of
+    its left and right input.
+
+    The combined file holds the signals of fd_left except its EDF
+    Annotations, followed by all signals of fd_right, truncated to the
+    shortest input. Every signal is compared through strided views of the
+    memory-mapped data sections, chunk by chunk, so each file is read once
+    and sequentially.
+
+    Args:
+        fd_left (str): (Relative) path to the left input.
+        fd_right (str): (Relative) path to the right input.
+        fd_combined (str): (Relative) path to the combined file.
+        chunk_records (int, optional): The number of data records compared at
+            once. Defaults to ensemble_edf.CHUNK_RECORDS.
+
+    Returns:
+        dict: The path of the combined file, whether it matches, and per
+            signal its label, source file and whether it matches.
+    """
+    header_left = ensemble_edf.read_edf_header(fd_left)
+    header_right = ensemble_edf.read_edf_header(fd_right)
+    header_combined = ensemble_edf.read_edf_header(fd_combined)
+
+    chans_left = ensemble_edf.get_data_channel_indices(header_left)
+    sources = [(fd_left, header_left.signals[chan]) for chan in chans_left]
+    sources += [(fd_right, signal) for signal in header_right.signals]
+
+    n_records = min(
+        header_left.number_of_data_records, header_right.number_of_data_records
+    )
+    layout_matches = (
+        header_combined.number_of_data_records == n_records
+        and header_combined.number_of_signals == len(sources)
+        and all(
+            signal.nr_of_samples_in_each_data_record
+            == source.nr_of_samples_in_each_data_record
+            for signal, (_, source) in zip(
+                header_combined.signals, sources, strict=False
+            )
+        )
+    )
+    results = [
+        {"label": signal.label, "source": fd, "match": layout_matches}
+        for fd, signal in sources
+    ]
+
+    if layout_matches:
+        expected = ensemble_edf.get_signal_views(
+            ensemble_edf.memmap_edf_data(fd_left, header_left, end=n_records),
+            header_left,
+            chans_left,
+        )
+        expected += ensemble_edf.get_signal_views(
+            ensemble_edf.memmap_edf_data(fd_right, header_right, end=n_records),
+            header_right,
+        )
+        combined = ensemble_edf.get_signal_views(
+            ensemble_edf.memmap_edf_data(fd_combined, header_combined),
+            header_combined,
+        )
+        for start in range(0, n_records, chunk_records):
+            stop = start + chunk_records
+            for result, view, expected_view in zip(
+                results, combined, expected, strict=True
+            ):
+                if result["match"]:
+                    result["match"] = bool(
+                        np.array_equal(view[start:stop], expected_view[start:stop])
+                    )
+
+    return {
+        "combined": fd_combined,
+        "match": all(result["match"] for result in results),
+        "signals": results,
+    }
+
+
+def verify_files(files, jobs=None):
+    """
+    Verifies many files in a thread pool.
+
+    Reading and hashing release the GIL, so threads overlap the I/O and
+    hashing of different files.
+
+    Args:
+        files (list): (input, output) pairs checked with verify_data_section,
+            and/or (left, right, combined) triples checked with
+            verify_combined.
+        jobs (int, optional): The number of threads. Defaults to None, which
+            lets ThreadPoolExecutor choose.
+
+    Returns:
+        list: The result of every pair or triple, in the order of files.
+    """
+
+    def verify(paths):
+        if len(paths) == 3:
+            return verify_combined(*paths)
+        return verify_data_section(*paths)
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(verify, files))
+
+
+def verify_manifest(output_dir, jobs=None):
+    """
+    Checks the outputs of anonymize_eeg_ensemble against its manifest.
+
+    Only the outputs are read: the hash of every data section is compared
+    with the hash recorded while the input was copied.
+
+    Args:
+        output_dir (str): The output directory holding the manifest.
+        jobs (int, optional): The number of threads. Defaults to None, which
+            lets ThreadPoolExecutor choose.
+
+    Returns:
+        dict: The outputs that match and the outputs that are missing or do
+            not match their input.
+    """
+    manifest = read_manifest(os.path.join(output_dir, MANIFEST_FILENAME))
+    entries = [entry for entry in manifest.values() if entry["status"] == "done"]
+
+    def check(entry):
+        if not os.path.isfile(entry["output"]):
+            return False
+        return hash_data_section(entry["output"]) == entry["data_blake2b"]
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        matches = list(executor.map(check, entries))
+
+    return {
+        "verified": [e["output"] for e, ok in zip(entries, matches, strict=True) if ok],
+        "failed": [
+            e["output"] for e, ok in zip(entries, matches, strict=True) if not ok
+        ],
+    }